@@ -1,7 +1,10 @@
+import os
+
 from dash import Dash, dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import ThemeSwitchAIO
 
+from klupps_metrics import default_metrics
 from theme import url_theme1, url_theme2
 from utilities import UtilitiesModule
 
@@ -13,10 +16,15 @@ app = Dash(__name__, external_stylesheets=[url_theme1, dbc_css, custom_css])
 
 app.title = "KluppsHomeDash"
 
+# WSGI application for production servers, see gunicorn.conf.py.
+server = app.server
+
+# Polls the snapshot versions, unchanged versions are answered with an empty response. Modules publish new snapshots
+# when their sources change, so this is how quickly clients see new data.
 refresh_interval = dcc.Interval(
     id="refresh_interval",
     disabled=False,
-    interval=300*1000,
+    interval=15*1000,
     n_intervals=0
 )
 
@@ -64,6 +72,11 @@ navbar = dbc.Navbar(
 
 utilities_module = UtilitiesModule()
 utilities_module.is_available()
+utilities_module.registry.init_app(app.server)
+
+# Prometheus style metrics on /metrics, TRACE_REQUESTS=1 logs every request with its stage timings as JSON.
+default_metrics.init_app(app.server, trace_requests=os.environ.get('TRACE_REQUESTS') == '1')
+default_metrics.add_collector(utilities_module.registry.collect)
 
 app.layout = html.Div([
     navbar,
@@ -94,4 +107,9 @@ def toggle_navbar_collapse(n, is_open):
 
 
 if __name__ == '__main__':
+    # The server the service runs (setup.sh), gunicorn.conf.py serves the app with several workers. Load the data in
+    # the background while the layout is already served. With the reloader only the child process serving the app loads
+    # it, not the one watching the files.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        utilities_module.registry.start()
     app.run_server(debug=True, host="0.0.0.0")
@@ -0,0 +1,43 @@
+"""
+Compare the daily interpolation of every contract with np.interp with the previous resampling of all contracts and
+interpolating the stacked series, for a growing history.
+
+The synthetic contracts have readings on their first and last day and are numbered per meter, so both agree exactly,
+the previous version only differs where it interpolated the edges of a contract towards the next contract ID.
+
+    python -m benchmarks.daily_interpolation [--meters 30]
+"""
+import argparse
+import warnings
+from functools import partial
+
+from pandas.testing import assert_frame_equal
+
+from benchmarks import legacy
+from benchmarks.measure import measure
+from benchmarks.synthetic import generate_sources
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    print(f"{'years':>6}{'readings':>10}{'daily rows':>12}{'resample (ms)':>15}{'peak (MB)':>11}"
+          f"{'np.interp (ms)':>16}{'peak (MB)':>11}")
+    for years, readings_per_month in [(10, 2), (10, 30), (30, 2), (30, 30), (60, 30)]:
+        sources = generate_sources(meters=args.meters, years=years, readings_per_month=readings_per_month)
+        readings = UtilityDataFetcherCSV.prepare_readings(sources['measurements'], sources['contracts'])
+        expected, resample_seconds, resample_peak = measure(
+            partial(legacy.resample_interpolate, readings, sources['contracts']))
+        actual, interp_seconds, interp_peak = measure(
+            partial(UtilityDataFetcherCSV.interpolate_daily, readings, sources['contracts']))
+        assert_frame_equal(actual, expected, check_exact=True)
+        print(f"{years:>6}{len(readings):>10}{len(actual):>12}{resample_seconds * 1000:>15.1f}"
+              f"{resample_peak / 2 ** 20:>11.1f}{interp_seconds * 1000:>16.1f}{interp_peak / 2 ** 20:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Figure payload size against fidelity of the server side downsampling.
+
+For every point budget the figure is built with LTTB and with min-max downsampling, the JSON size sent to the browser
+and the largest deviation of the drawn line from the full series (relative to the range of the trace) are reported.
+
+    python -m benchmarks.downsampling [--meters 3] [--years 10]
+"""
+import argparse
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.measure import best_of
+from benchmarks.synthetic import generate_utility_data
+from utilities.downsampling import downsample
+from utilities.utility_figures import create_line_plot
+
+
+def max_relative_error(df: pd.DataFrame, reduced: pd.DataFrame) -> float:
+    """Largest distance of the line through `reduced` from the line through `df`, relative to the range of the trace."""
+    error = 0.0
+    for key, trace in df.groupby(['contract', 'type'], sort=False):
+        kept = reduced[(reduced.contract == key[0]) & (reduced.type == key[1])]
+        x = pd.to_numeric(trace.date).to_numpy(dtype=float)
+        y = trace.amount.to_numpy(dtype=float)
+        # Both lines go through np.interp, so repeated dates resolve the same way in both.
+        line = np.interp(x, x, y)
+        drawn = np.interp(x, pd.to_numeric(kept.date).to_numpy(dtype=float), kept.amount.to_numpy(dtype=float))
+        spread = y.max() - y.min()
+        if spread > 0:
+            error = max(error, float(np.abs(drawn - line).max() / spread))
+    return error
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=3)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--graph-type', default='Price')
+    parser.add_argument('--budgets', type=int, nargs='+', default=[100, 200, 400, 800])
+    args = parser.parse_args()
+
+    utility_data = generate_utility_data(meters=args.meters, years=args.years)
+    utility_type = utility_data.contracts_df.Type.iloc[0]
+    years = utility_data.contracts_df.ContractYear
+    contract_period = [int(years.min()), int(years.max())]
+
+    measurements_df = utility_data.measurements_df.merge(
+        utility_data.contracts_df[utility_data.contracts_df.Type == utility_type], left_on='contract', right_on='ID')
+    column = 'aggregate_price' if args.graph_type == 'Price' else 'aggregate_consumption'
+    df = measurements_df[['date', column, 'contract']].rename(columns={column: 'amount'}).sort_values('date')
+    df['type'] = args.graph_type
+    print(f"{utility_type}: {len(df)} points in {df.contract.nunique()} traces")
+
+    def figure(max_points):
+        return create_line_plot(utility_data, utility_type, contract_period, args.graph_type, None, max_points)
+
+    full = figure(None).to_json()
+    print(f"{'budget':>8}{'size (kB)':>12}{'build (ms)':>12}{'lttb error':>12}{'minmax error':>14}")
+    _, build = best_of(partial(figure, None))
+    print(f"{'all':>8}{len(full) / 1024:>12.1f}{build * 1000:>12.1f}{0:>12.4f}{0:>14.4f}")
+    for max_points in args.budgets:
+        size = len(figure(max_points).to_json())
+        _, build = best_of(partial(figure, max_points))
+        errors = [
+            max_relative_error(df, downsample(df, 'date', 'amount', ['contract', 'type'], max_points, method))
+            for method in ['lttb', 'minmax']
+        ]
+        print(f"{max_points:>8}{size / 1024:>12.1f}{build * 1000:>12.1f}{errors[0]:>12.4f}{errors[1]:>14.4f}")
+
+
+if __name__ == '__main__':
+    main()
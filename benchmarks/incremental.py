@@ -0,0 +1,74 @@
+"""
+Check that incremental refreshes of UtilityDataFetcherCSV match a full rebuild, and time both.
+
+    python -m benchmarks.incremental [--meters 30] [--years 10]
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from benchmarks.synthetic import generate_sources, write_sources
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def append_reading(sources):
+    measurements = sources['measurements']
+    last = measurements.iloc[-1]
+    reading = last.copy()
+    reading['date'] = last['date'] + pd.Timedelta(days=3)
+    reading['aggregate_consumption'] = last['aggregate_consumption'] + 12.5
+    sources['measurements'] = pd.concat([measurements, reading.to_frame().T], ignore_index=True)
+
+
+def correct_old_reading(sources):
+    sources['measurements'].loc[5, 'aggregate_consumption'] += 1.25
+
+
+def change_anex_price(sources):
+    sources['contract_anex'].loc[len(sources['contract_anex']) // 2, 'Price/Unit'] *= 1.1
+
+
+def remove_contract(sources):
+    contract_id = sources['contracts']['ID'].iloc[len(sources['contracts']) // 3]
+    for name, column in [('contracts', 'ID'), ('measurements', 'contract'), ('contract_anex', 'ContractID')]:
+        sources[name] = sources[name][sources[name][column] != contract_id].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    sources = generate_sources(meters=args.meters, years=args.years)
+    with tempfile.TemporaryDirectory() as directory:
+        arguments = write_sources(sources, directory)
+        incremental = UtilityDataFetcherCSV(**arguments, incremental=True, snapshot_dir=None)
+        print(f"{'change':<22}{'incremental (ms)':>18}{'full (ms)':>12}{'identical':>11}")
+        for change in [append_reading, correct_old_reading, change_anex_price, remove_contract]:
+            change(sources)
+            write_sources(sources, directory)
+            # Make sure the modification time moves even on coarse grained file systems.
+            for path in arguments.values():
+                os.utime(path, ns=(time.time_ns(), time.time_ns()))
+
+            start = time.perf_counter()
+            incremental.refresh()
+            incremental_time = time.perf_counter() - start
+            start = time.perf_counter()
+            full = UtilityDataFetcherCSV(**arguments, snapshot_dir=None)
+            full_time = time.perf_counter() - start
+
+            assert_frame_equal(incremental.measurements_df, full.measurements_df, check_exact=True)
+            assert_frame_equal(incremental.contract_payment_plan_df, full.contract_payment_plan_df, check_exact=True)
+            print(f"{change.__name__:<22}{incremental_time * 1000:>18.1f}{full_time * 1000:>12.1f}{'yes':>11}")
+
+
+if __name__ == '__main__':
+    main()
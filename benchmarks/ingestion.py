@@ -0,0 +1,53 @@
+"""
+Compare reading the sources with their declared schemas with the previous read_csv with inferred types and dates, as
+the measurement history grows.
+
+    python -m benchmarks.ingestion [--meters 30] [--years 10]
+"""
+import argparse
+import os
+import tempfile
+import warnings
+from functools import partial
+
+import pandas as pd
+
+from benchmarks.measure import best_of
+from benchmarks.synthetic import generate_sources, write_sources
+from utilities.data import csv_schema
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def inferred_read(path: str, name: str):
+    df = pd.read_csv(path)
+    for column in UtilityDataFetcherCSV.schemas[name].dates:
+        df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    engine = 'arrow' if csv_schema.pyarrow is not None else 'pandas'
+    print(f"{'readings/month':>15}{'source':>24}{'rows':>9}{'MB':>7}{'inferred (ms)':>15}"
+          f"{f'schema, {engine} (ms)':>22}")
+    for readings_per_month in [2, 8, 30]:
+        sources = generate_sources(meters=args.meters, years=args.years, readings_per_month=readings_per_month)
+        with tempfile.TemporaryDirectory() as directory:
+            arguments = write_sources(sources, directory)
+            for name, schema in UtilityDataFetcherCSV.schemas.items():
+                path = arguments[f"{name}_source"]
+                expected, inferred_seconds = best_of(partial(inferred_read, path, name))
+                actual, schema_seconds = best_of(partial(schema.read, path, name))
+                # Text columns may hold None instead of NaN for missing values.
+                assert actual.astype(object).equals(expected[list(schema.columns)].astype(object))
+                print(f"{readings_per_month:>15}{name:>24}{len(actual):>9}{os.path.getsize(path) / 2 ** 20:>7.1f}"
+                      f"{inferred_seconds * 1000:>15.1f}{schema_seconds * 1000:>22.1f}")
+
+
+if __name__ == '__main__':
+    main()
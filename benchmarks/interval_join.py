@@ -0,0 +1,59 @@
+"""
+Compare the interval join assigning every day its contract anex with merging every day with all anexes of its
+contract and filtering, for a growing number of anexes per contract.
+
+    python -m benchmarks.interval_join [--meters 30] [--years 10]
+"""
+import argparse
+import time
+import warnings
+from functools import partial
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+
+from benchmarks.measure import measure
+from benchmarks.synthetic import generate_sources
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+ANEX_COLUMNS = ['ContractID', 'AnexStart', 'AnexEnd', 'Price/Unit', 'YearlyBasePrice', 'VAT%']
+
+
+def merge_then_filter(df: DataFrame, contract_anex_df: DataFrame):
+    df = df.merge(contract_anex_df[ANEX_COLUMNS], left_on='contract', right_on='ContractID', sort=False)
+    return df[(df['date'] >= df['AnexStart']) & (df['date'] <= df['AnexEnd'])].reset_index(drop=True)
+
+
+def interval_join(df: DataFrame, contract_anex_df: DataFrame):
+    return UtilityDataFetcherCSV.interval_join(df, 'contract', 'date', contract_anex_df[ANEX_COLUMNS], 'ContractID',
+                                               'AnexStart', 'AnexEnd')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    print(f"{'anexes':>8}{'daily rows':>12}{'merge (ms)':>12}{'peak (MB)':>11}{'join (ms)':>11}{'peak (MB)':>11}"
+          f"{'prepare_data (ms)':>19}")
+    for anexes_per_contract in [1, 2, 4, 12, 52]:
+        sources = generate_sources(meters=args.meters, years=args.years, anexes_per_contract=anexes_per_contract)
+        measurements, contracts, anexes = sources['measurements'], sources['contracts'], sources['contract_anex']
+        daily = UtilityDataFetcherCSV.prepare_data(measurements, contracts, anexes)
+        # The days of every contract as they reach the pricing step.
+        days = daily[['date', 'contract']].drop_duplicates(ignore_index=True)
+
+        expected, merge_seconds, merge_peak = measure(partial(merge_then_filter, days, anexes))
+        actual, join_seconds, join_peak = measure(partial(interval_join, days, anexes))
+        assert_frame_equal(actual, expected, check_exact=True)
+        start = time.perf_counter()
+        UtilityDataFetcherCSV.prepare_data(measurements, contracts, anexes)
+        prepare_seconds = time.perf_counter() - start
+        print(f"{anexes_per_contract:>8}{len(days):>12}{merge_seconds * 1000:>12.1f}{merge_peak / 2 ** 20:>11.1f}"
+              f"{join_seconds * 1000:>11.1f}{join_peak / 2 ** 20:>11.1f}{prepare_seconds * 1000:>19.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Requests per second and latency of the dashboard under concurrent clients, for the development server app.py runs and
+for gunicorn with gunicorn.conf.py, both on synthetic CSVs.
+
+Every client polls the snapshot versions and asks for figures of random utility types, periods, graph types and graph
+widths like a browser does, most figures are not cached yet. Servers are started on free local ports, `--url` runs the
+clients against a server that is already running instead.
+
+    python -m benchmarks.load [--clients 8] [--duration 20] [--workers 4] [--threads 4]
+    python -m benchmarks.load --url http://127.0.0.1:8050
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import requests
+
+from benchmarks.synthetic import generate_sources, write_sources
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+REFRESH_OUTPUT = '..utility_data_store.data...utility_data_loading_interval.disabled..'
+TYPES_OUTPUT = '..utility_type_chooser.options...utility_type_chooser.value..'
+YEARS_OUTPUT = ('..utility_contract_year_chooser.min...utility_contract_year_chooser.max...'
+                'utility_contract_year_chooser.value...utility_contract_year_chooser.marks..')
+FIGURE_OUTPUT = 'utility_figure_store.data'
+
+
+def prop(component_id: str, name: str, value=None) -> dict:
+    return {'id': component_id, 'property': name, 'value': value}
+
+
+def call(session: requests.Session, url: str, output: str, inputs: list, state: list = ()):
+    """Call a callback like the Dash renderer does and return the response data by output id, None for no update."""
+    outputs = [
+        {'id': part.split('.')[0], 'property': part.split('.')[1]}
+        for part in output.strip('.').split('...')
+    ]
+    response = session.post(f"{url}/_dash-update-component", json={
+        'output': output,
+        'outputs': outputs if output.startswith('..') else outputs[0],
+        'inputs': inputs,
+        'state': list(state),
+        'changedPropIds': [f"{inputs[0]['id']}.{inputs[0]['property']}"]
+    })
+    if response.status_code == 204:
+        return None
+    response.raise_for_status()
+    return {
+        component_id: properties for component_id, properties in response.json()['response'].items()
+    }
+
+
+def refresh(session, url, version=None):
+    # Until the first snapshot the loading interval polls, with a version the app wide interval does.
+    return call(session, url, REFRESH_OUTPUT, [prop('refresh_interval', 'n_intervals', 1),
+                                               prop('utility_data_loading_interval', 'n_intervals', 1)],
+                [prop('utility_data_store', 'data', version),
+                 prop('utility_data_loading_interval', 'disabled', version is not None)])
+
+
+def wait_for_data(url: str, timeout: float = 120):
+    """Wait until the server answers and has published its first snapshot, return the version and the views."""
+    session = requests.Session()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = refresh(session, url)
+            if response is not None and 'utility_data_store' in response:
+                version = response['utility_data_store']['data']
+                break
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} did not load the utility data in {timeout} s")
+        time.sleep(0.2)
+    options = call(session, url, TYPES_OUTPUT, [prop('utility_data_store', 'data', version)])
+    views = []
+    for option in options['utility_type_chooser']['options']:
+        utility_type = option['value']
+        years = call(session, url, YEARS_OUTPUT, [prop('utility_data_store', 'data', version),
+                                                 prop('utility_type_chooser', 'value', utility_type)])
+        views.append((utility_type, years['utility_contract_year_chooser']['min'],
+                      years['utility_contract_year_chooser']['max']))
+    return version, views
+
+
+def run_clients(url: str, clients: int, duration: float, seed: int = 0):
+    """Run the clients for `duration` seconds, return the latency of every request and the number of errors."""
+    version, views = wait_for_data(url)
+    latencies = []
+    errors = []
+    stop = time.monotonic() + duration
+
+    def client(number):
+        session = requests.Session()
+        rng = random.Random(seed + number)
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                if rng.random() < 0.5:
+                    refresh(session, url, version)
+                else:
+                    utility_type, first, last = rng.choice(views)
+                    start_year = rng.randint(first, last)
+                    call(session, url, FIGURE_OUTPUT, [
+                        prop('utility_data_store', 'data', version),
+                        prop('utility_type_chooser', 'value', utility_type),
+                        prop('utility_contract_year_chooser', 'value', [start_year, rng.randint(start_year, last)]),
+                        prop('utility_graph_type_chooser', 'value', rng.choice(['Consumption', 'Price'])),
+                        prop('utility_granularity_chooser', 'value', rng.choice(['D', 'D', 'W', 'M', 'Y'])),
+                        prop('utility_graph_view_store', 'data', {'width': rng.randrange(600, 1601, 100),
+                                                                  'x_range': None})
+                    ])
+                latencies.append(time.perf_counter() - start)
+            except requests.RequestException:
+                errors.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), len(errors)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, port: int, sources: dict, workers: int, threads: int) -> subprocess.Popen:
+    if mode == 'development':
+        command = [sys.executable, '-m', 'benchmarks.load_app', str(port)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f"127.0.0.1:{port}",
+                   '-w', str(workers), '--threads', str(threads), 'benchmarks.load_app:server']
+    env = dict(os.environ, LOAD_TEST_SOURCES=json.dumps(sources), PYTHONWARNINGS='ignore')
+    return subprocess.Popen(command, cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def report(name: str, latencies, errors: int, duration: float):
+    if len(latencies) == 0:
+        print(f"{name:<24}{'no successful requests':>48}{errors:>8}")
+        return
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    print(f"{name:<24}{len(latencies) / duration:>10.1f}{p50:>12.0f}{p95:>12.0f}{latencies.max() * 1000:>14.0f}"
+          f"{errors:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help="run the clients against this server instead of starting the servers")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    print(f"{args.clients} clients for {args.duration:.0f} s on {os.cpu_count()} CPUs")
+    print(f"{'server':<24}{'req/s':>10}{'p50 (ms)':>12}{'p95 (ms)':>12}{'max (ms)':>14}{'errors':>8}")
+    if args.url:
+        report(args.url, *run_clients(args.url.rstrip('/'), args.clients, args.duration), args.duration)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources = dict(write_sources(generate_sources(meters=args.meters, years=args.years), directory),
+                       snapshot_dir=os.path.join(directory, 'snapshots'))
+        for mode, name in [('development', 'app.py dev server'),
+                           ('gunicorn', f"gunicorn {args.workers}x{args.threads}")]:
+            port = free_port()
+            server = start_server(mode, port, sources, args.workers, args.threads)
+            try:
+                report(name, *run_clients(f"http://127.0.0.1:{port}", args.clients, args.duration), args.duration)
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+"""
+The dashboard on the sources of a load test, see benchmarks.load. LOAD_TEST_SOURCES holds the UtilityDataFetcherCSV
+arguments as JSON.
+
+    gunicorn -c gunicorn.conf.py benchmarks.load_app:server
+    python -m benchmarks.load_app PORT
+"""
+import json
+import os
+import sys
+from functools import partial
+
+import app as dashboard
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+dashboard.utilities_module.utility_data_cache.fetcher_factory = partial(
+    UtilityDataFetcherCSV, incremental=True, **json.loads(os.environ['LOAD_TEST_SOURCES']))
+server = dashboard.server
+
+if __name__ == '__main__':
+    # Served like app.py does, without the reloader.
+    dashboard.utilities_module.registry.start()
+    dashboard.app.run_server(debug=True, use_reloader=False, host='127.0.0.1', port=int(sys.argv[1]))
@@ -0,0 +1,50 @@
+"""
+Timing and memory helpers shared by the benchmarks. They call `function` without arguments, pass a lambda or
+functools.partial for functions that take some.
+"""
+import time
+import tracemalloc
+
+
+def best_of(function, repeat=3, setup=None):
+    """
+    Return the result of the last run and the best time in seconds of `repeat` runs.
+
+    `setup` is called untimed before every run.
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def peak_memory(function):
+    """Return the result and the peak of memory allocated by one run."""
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def measure(function, repeat=1, setup=None, memory=True):
+    """
+    Return the result, the best time in seconds of `repeat` runs and the peak of memory allocated by one more run.
+
+    `setup` is called untimed before every run. Without `memory` there is no extra run, the result is the one of the
+    last timed run and the peak None.
+    """
+    result, best = best_of(function, repeat, setup)
+    if not memory:
+        return result, best, None
+    if setup is not None:
+        setup()
+    result, peak = peak_memory(function)
+    return result, best, peak
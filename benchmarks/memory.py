@@ -0,0 +1,45 @@
+"""
+Memory held by a UtilityData snapshot with the prepared frames in plain dtypes (object IDs, float64 everywhere) and in
+the compact dtypes UtilityDataFetcherCSV stores, and the peak memory of preparing the measurements.
+
+    python -m benchmarks.memory [--meters 30] [--years 10]
+"""
+import argparse
+import warnings
+from functools import partial
+
+from benchmarks.measure import peak_memory
+from benchmarks.synthetic import generate_sources
+from utilities.data.utility_data import UtilityData
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    sources = generate_sources(meters=args.meters, years=args.years)
+    measurements_df, peak = peak_memory(partial(
+        UtilityDataFetcherCSV.prepare_data, sources['measurements'], sources['contracts'], sources['contract_anex']))
+    measurements_df = UtilityDataFetcherCSV.sort_measurements(measurements_df)
+    payment_plan_df = UtilityDataFetcherCSV.prepare_payment_plan(
+        sources['contract_payment_plan'], sources['contract_settlement'], sources['contracts'])
+    plain = UtilityData(measurements_df, sources['contracts'], sources['contract_anex'], payment_plan_df,
+                        sources['contract_settlement'], sources['contract_bonus'])
+    compact = UtilityData(UtilityDataFetcherCSV.compact_measurements(measurements_df), sources['contracts'],
+                          sources['contract_anex'], UtilityDataFetcherCSV.compact_payment_plan(payment_plan_df),
+                          sources['contract_settlement'], sources['contract_bonus'])
+
+    print(f"{len(measurements_df)} daily rows, peak memory of prepare_data {peak / 2 ** 20:.1f} MB")
+    print(f"{'frame':<28}{'plain (kB)':>12}{'compact (kB)':>14}")
+    plain_report, compact_report = plain.memory_report(), compact.memory_report()
+    for name in UtilityData.frames:
+        print(f"{name:<28}{plain_report[name] / 1024:>12.1f}{compact_report[name] / 1024:>14.1f}")
+    print(f"{'total':<28}{sum(plain_report.values()) / 1024:>12.1f}{sum(compact_report.values()) / 1024:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare the vectorized meter restart handling with the old per meter, per restart loop.
+
+    python -m benchmarks.meter_restarts
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import legacy
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def generate_readings(meters, readings, restarts, seed=0):
+    """Readings of several meters interleaved by date, each meter restarting its counter `restarts` times."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for meter in range(meters):
+        consumption = np.cumsum(rng.uniform(1, 50, readings)).round(2)
+        for restart in np.sort(rng.choice(np.arange(1, readings), size=restarts, replace=False)):
+            consumption[restart:] -= consumption[restart]
+        frames.append(pd.DataFrame({
+            'date': pd.Timestamp('2000-01-01') + pd.to_timedelta(np.sort(rng.choice(20000, readings, replace=False)),
+                                                                 unit='D'),
+            'TypeAddress': f"Meter {meter}",
+            'aggregate_consumption': consumption
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    df.sort_values(by='date', inplace=True, ignore_index=True)
+    return df
+
+
+def main():
+    print(f"{'meters':>8}{'restarts':>10}{'rows':>8}{'legacy (ms)':>14}{'vectorized (ms)':>18}{'max diff':>12}")
+    for meters, readings, restarts in [(3, 100, 2), (10, 200, 5), (30, 400, 10), (60, 800, 20)]:
+        df = generate_readings(meters, readings, restarts)
+        start = time.perf_counter()
+        expected = legacy.continue_restarted_meters(df)
+        legacy_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = UtilityDataFetcherCSV.continue_restarted_meters(df)
+        vectorized_seconds = time.perf_counter() - start
+        # The offsets of consecutive restarts are summed in a different order, so allow for rounding.
+        np.testing.assert_allclose(actual, expected, rtol=1e-12)
+        print(f"{meters:>8}{restarts:>10}{len(df):>8}{legacy_seconds * 1000:>14.1f}{vectorized_seconds * 1000:>18.1f}"
+              f"{np.abs(actual - expected).max():>12.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Time prepare_data and prepare_payment_plan against the legacy implementation and check that the output matches.
+
+    python -m benchmarks.prepare [--scales 3x4 30x10 100x20] [--skip-legacy-above 20000]
+"""
+import argparse
+import warnings
+from functools import partial
+
+from pandas.testing import assert_frame_equal
+
+from benchmarks import legacy
+from benchmarks.measure import measure
+from benchmarks.synthetic import generate_sources
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', nargs='+', default=['3x4', '30x10', '100x20'],
+                        help="meters x years, every meter has one contract per year")
+    parser.add_argument('--resets', type=int, default=0,
+                        help="counter restarts per meter, restarts make the output differ in the last bits")
+    parser.add_argument('--skip-legacy-above', type=int, default=200000,
+                        help="do not run the legacy implementation for more daily rows than this")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    print(f"{'contracts':>10}{'daily rows':>12}{'step':>22}{'legacy (ms)':>14}{'current (ms)':>14}{'identical':>11}")
+    for scale in args.scales:
+        meters, years = (int(value) for value in scale.split('x'))
+        sources = generate_sources(meters=meters, years=years, resets=args.resets)
+        steps = {
+            'prepare_data': (legacy.prepare_data, UtilityDataFetcherCSV.prepare_data,
+                             [sources['measurements'], sources['contracts'], sources['contract_anex']]),
+            'prepare_payment_plan': (legacy.prepare_payment_plan, UtilityDataFetcherCSV.prepare_payment_plan,
+                                     [sources['contract_payment_plan'], sources['contract_settlement'],
+                                      sources['contracts']])
+        }
+        rows = None
+        for step, (legacy_function, current_function, inputs) in steps.items():
+            current, current_time, _ = measure(partial(current_function, *inputs), memory=False)
+            rows = rows or len(current)
+            legacy_time, identical = float('nan'), '-'
+            if rows <= args.skip_legacy_above:
+                expected, legacy_time, _ = measure(partial(legacy_function, *inputs), memory=False)
+                assert_frame_equal(current.reset_index(drop=True), expected.reset_index(drop=True),
+                                   check_exact=args.resets == 0, check_dtype=False, check_categorical=False)
+                identical = 'yes' if args.resets == 0 else 'close'
+            print(f"{meters * years:>10}{rows:>12}{step:>22}{legacy_time * 1000:>14.1f}{current_time * 1000:>14.1f}"
+                  f"{identical:>11}")
+
+
+if __name__ == '__main__':
+    main()
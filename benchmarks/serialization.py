@@ -0,0 +1,83 @@
+"""
+Compare the UtilityData snapshot format with the old regex built JSON blob.
+
+    python -m benchmarks.serialization [--meters 30] [--years 10]
+"""
+import argparse
+import re
+
+from pandas import read_json
+from pandas.testing import assert_frame_equal
+
+from benchmarks.measure import best_of
+from benchmarks.synthetic import generate_utility_data
+from utilities.data.utility_data import UtilityData
+
+
+def legacy_to_json(utility_data: UtilityData, date_format="iso", orient="split"):
+    frames = {name: getattr(utility_data, name).to_json(date_format=date_format, orient=orient)
+              for name in UtilityData.frames}
+    json_object = f"""
+            {{
+                "measurements_df": {frames['measurements_df']},
+                "contracts_df": {frames['contracts_df']},
+                "contract_anex_df": {frames['contract_anex_df']},
+                "contract_payment_plan_df": {frames['contract_payment_plan_df']},
+                "contract_settlement_df": {frames['contract_settlement_df']},
+                "contract_bonus_df": {frames['contract_bonus_df']}
+            }}
+        """
+    return re.sub(r"[\n\t\s]*", "", json_object)
+
+
+def legacy_from_json(json_data, orient='split'):
+    json_data = json_data[19:-1]
+    measurements, json_data = json_data.split(",\"contracts_df\":")
+    contracts, json_data = json_data.split(",\"contract_anex_df\":")
+    contract_anex, json_data = json_data.split(",\"contract_payment_plan_df\":")
+    contract_payment_plan, json_data = json_data.split(",\"contract_settlement_df\":")
+    contract_settlement, contract_bonus = json_data.split(",\"contract_bonus_df\":")
+    return UtilityData(*[read_json(frame, orient=orient) for frame in [
+        measurements, contracts, contract_anex, contract_payment_plan, contract_settlement, contract_bonus
+    ]])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    utility_data = generate_utility_data(meters=args.meters, years=args.years)
+    print(f"measurements: {len(utility_data.measurements_df)} rows")
+
+    legacy = legacy_to_json(utility_data)
+    candidates = {
+        'legacy json': (lambda: legacy_to_json(utility_data), lambda: legacy_from_json(legacy), len(legacy))
+    }
+    for encoding in ['arrow', 'json']:
+        try:
+            data = utility_data.to_bytes(encoding)
+        except (ValueError, AttributeError):
+            print(f"{encoding}: not available")
+            continue
+        candidates[f"snapshot {encoding}"] = (
+            lambda encoding=encoding: utility_data.to_bytes(encoding),
+            lambda data=data: UtilityData.from_bytes(data),
+            len(data)
+        )
+        restored = UtilityData.from_bytes(data)
+        for name in UtilityData.frames:
+            assert_frame_equal(getattr(utility_data, name), getattr(restored, name),
+                               check_exact=True)
+
+    print(f"{'format':<16}{'size (kB)':>12}{'serialize (ms)':>16}{'deserialize (ms)':>18}")
+    for name, (serialize, deserialize, size) in candidates.items():
+        _, serialize_seconds = best_of(serialize, args.repeat)
+        _, deserialize_seconds = best_of(deserialize, args.repeat)
+        print(f"{name:<16}{size / 1024:>12.1f}{serialize_seconds * 1000:>16.1f}{deserialize_seconds * 1000:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
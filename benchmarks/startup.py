@@ -0,0 +1,64 @@
+"""
+Startup of the dashboard: importing app.py, serving the first page and the layout, and loading the first snapshot in
+the background, every run in a fresh interpreter on synthetic CSVs. The first run prepares the snapshot and persists it,
+the later runs load it from the snapshot store.
+
+    python -m benchmarks.startup [--meters 30] [--years 10] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+
+from benchmarks.synthetic import generate_sources, write_sources
+
+STARTUP_SCRIPT = """
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+start = time.perf_counter()
+import app
+timings = {'import app': time.perf_counter() - start}
+
+from functools import partial
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+app.utilities_module.utility_data_cache.fetcher_factory = partial(
+    UtilityDataFetcherCSV, incremental=True, **json.loads(sys.argv[1]))
+client = app.app.server.test_client()
+for path in ['/', '/_dash-layout', '/_dash-dependencies']:
+    assert client.get(path).status_code == 200
+    timings[f"GET {path}"] = time.perf_counter() - start
+while app.utilities_module.utility_data_cache.data is None:
+    time.sleep(0.01)
+timings['first snapshot'] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_arguments = dict(write_sources(generate_sources(meters=args.meters, years=args.years), directory),
+                             snapshot_dir=os.path.join(directory, 'snapshots'))
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, json.dumps(csv_arguments)],
+                                    check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'since start':<24}{'best (ms)':>12}{'worst (ms)':>12}")
+    for name in runs[0]:
+        values = [run[name] for run in runs]
+        print(f"{name:<24}{min(values) * 1000:>12.0f}{max(values) * 1000:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
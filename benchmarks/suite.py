@@ -0,0 +1,213 @@
+"""
+Time and peak memory of every stage of the utilities pipeline and of the card's callbacks, on synthetic CSVs.
+
+Stages are run `--repeat` times for the best time and once more under tracemalloc for the peak memory allocated by the
+stage. `--output` writes the results as JSON, `--compare` reports the stages that got slower than such a baseline by
+more than `--tolerance`, and exits with 1 if any did.
+
+    python -m benchmarks.suite [--meters 30] [--years 10] [--readings-per-month 2] [--resets 1]
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --compare baseline.json
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import warnings
+from functools import partial
+
+from dash import Dash
+
+from benchmarks.measure import measure
+from benchmarks.synthetic import generate_sources, write_sources
+from klupps_snapshot_registry import SnapshotRegistry
+from utilities import UtilitiesModule
+from utilities.data.utility_data import UtilityData
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+from utilities.utility_figures import GRANULARITIES
+
+
+def callback(app: Dash, output: str):
+    """The function registered for `output`, called with plain arguments instead of a Dash request."""
+    return app.callback_map[output]['callback'].__wrapped__
+
+
+def fetcher_stages(csv_arguments, repeat):
+    stages = {}
+    fetcher, seconds, peak = measure(lambda: UtilityDataFetcherCSV(**csv_arguments), repeat)
+    stages['fetcher: cold refresh'] = (seconds, peak)
+    # Per source fetch / parse and per preparation step of a cold refresh, as recorded by the fetcher. The refresh
+    # measured last ran under tracemalloc, which slows it down.
+    for name, timings in UtilityDataFetcherCSV(**csv_arguments).source_timings.items():
+        for step, step_seconds in timings.items():
+            stages[f"  {name}: {step}"] = (step_seconds, None)
+    _, seconds, peak = measure(fetcher.refresh, repeat)
+    stages['fetcher: unchanged refresh'] = (seconds, peak)
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        UtilityDataFetcherCSV(**dict(csv_arguments, snapshot_dir=snapshot_dir))
+        stages['fetcher: stored snapshot'] = measure(
+            lambda: UtilityDataFetcherCSV(**dict(csv_arguments, snapshot_dir=snapshot_dir)), repeat)[1:]
+    return fetcher, stages
+
+
+def preparation_stages(sources, repeat):
+    measurements, contracts, anexes = sources['measurements'], sources['contracts'], sources['contract_anex']
+    readings = UtilityDataFetcherCSV.prepare_readings(measurements, contracts)
+    daily = UtilityDataFetcherCSV.prepare_data(measurements, contracts, anexes)
+    functions = {
+        'prepare_readings': lambda: UtilityDataFetcherCSV.prepare_readings(measurements, contracts),
+        'prepare_daily': lambda: UtilityDataFetcherCSV.prepare_daily(readings, contracts, anexes),
+        'prepare_data': lambda: UtilityDataFetcherCSV.prepare_data(measurements, contracts, anexes),
+        'sort_measurements': lambda: UtilityDataFetcherCSV.sort_measurements(daily),
+        'prepare_payment_plan': lambda: UtilityDataFetcherCSV.prepare_payment_plan(
+            sources['contract_payment_plan'], sources['contract_settlement'], contracts)
+    }
+    return {name: measure(function, repeat)[1:] for name, function in functions.items()}
+
+
+def serialization_stages(utility_data: UtilityData, repeat):
+    json_data, seconds, peak = measure(utility_data.to_json, repeat)
+    stages = {'to_json': (seconds, peak)}
+    stages['from_json'] = measure(lambda: UtilityData.from_json(json_data), repeat)[1:]
+    return stages, len(json_data)
+
+
+def create_module(csv_arguments):
+    """A UtilitiesModule on the CSVs with its own registry, and its callbacks by name."""
+    app = Dash(__name__)
+    module = UtilitiesModule(registry=SnapshotRegistry())
+    module.utility_data_cache.fetcher_factory = partial(UtilityDataFetcherCSV, incremental=True, **csv_arguments)
+    module.utility_figure_cache.prewarm = False
+    module.get_card(app)
+    callbacks = {
+        'refresh_utility_data': callback(
+            app, '..utility_data_store.data...utility_data_loading_interval.disabled..'),
+        'update_utility_type_chooser': callback(
+            app, '..utility_type_chooser.options...utility_type_chooser.value..'),
+        'update_contract_chooser': callback(
+            app, '..utility_contract_year_chooser.min...utility_contract_year_chooser.max...'
+                 'utility_contract_year_chooser.value...utility_contract_year_chooser.marks..'),
+        'create_line_plot': callback(app, 'utility_figure_store.data')
+    }
+    return module, callbacks
+
+
+def callback_stages(csv_arguments, repeat):
+    stages = {}
+    modules = []
+
+    def first_load_setup():
+        modules.append(create_module(csv_arguments))
+
+    def first_load():
+        # The snapshot is loaded in the background, the loading interval polls until it is published.
+        module, callbacks = modules[-1]
+        version, _ = callbacks['refresh_utility_data'](0, 0, None, False)
+        while module.utility_data_cache.data is None:
+            time.sleep(0.005)
+            version, _ = callbacks['refresh_utility_data'](0, 0, None, False)
+        return version
+
+    _, seconds, peak = measure(first_load, repeat, first_load_setup)
+    stages['refresh_utility_data: first load'] = (seconds, peak)
+    for module, _ in modules[:-1]:
+        module.registry.stop()
+    module, callbacks = modules[-1]
+    version = module.utility_data_cache.version
+
+    stages['refresh_utility_data: poll'] = measure(
+        lambda: callbacks['refresh_utility_data'](1, 0, version, True), repeat)[1:]
+    (_, utility_type), seconds, peak = measure(lambda: callbacks['update_utility_type_chooser'](version), repeat)
+    stages['update_utility_type_chooser'] = (seconds, peak)
+    (_, _, contract_period, _), seconds, peak = measure(
+        lambda: callbacks['update_contract_chooser'](version, utility_type), repeat)
+    stages['update_contract_chooser'] = (seconds, peak)
+    for graph_type in ['Consumption', 'Price']:
+        for granularity, view in [('D', None), ('D', {'width': 800, 'x_range': None}), ('M', None)]:
+            def build():
+                return callbacks['create_line_plot'](version, utility_type, contract_period, graph_type, granularity,
+                                                     view).to_json()
+            figure, seconds, peak = measure(build, repeat, module.utility_figure_cache.figures.clear)
+            label = ('all points' if view is None else f"{view['width']} px") + \
+                (f", {GRANULARITIES[granularity].lower()}" if granularity != 'D' else "")
+            stages[f"create_line_plot: {graph_type}, {label}"] = (seconds, peak)
+            stages[f"  figure json: {graph_type}, {label} ({len(figure) / 1024:.0f} kB)"] = (None, None)
+    def cached():
+        return callbacks['create_line_plot'](version, utility_type, contract_period, 'Price', 'D', None)
+    # The stages above leave the monthly figure in the cache, build the daily one first so every run is a hit.
+    cached()
+    stages['create_line_plot: cached'] = measure(cached, repeat)[1:]
+    module.registry.stop()
+    return stages
+
+
+def report(stages: dict):
+    print(f"{'stage':<58}{'time (ms)':>12}{'peak (MB)':>12}")
+    for name, (seconds, peak) in stages.items():
+        time_column = f"{seconds * 1000:>12.1f}" if seconds is not None else f"{'':>12}"
+        peak_column = f"{peak / 2 ** 20:>12.1f}" if peak is not None else f"{'':>12}"
+        print(f"{name:<58}{time_column}{peak_column}")
+
+
+def compare(stages: dict, baseline: dict, tolerance: float, min_delta: float) -> bool:
+    """
+    Print the stages slower than the baseline by more than `tolerance` and `min_delta` seconds, return whether there
+    were any. The absolute margin keeps sub millisecond stages from reporting noise.
+    """
+    regressions = []
+    for name, (seconds, _) in stages.items():
+        previous = baseline.get(name, [None])[0]
+        if seconds is None or previous is None or previous == 0:
+            continue
+        if seconds > previous * (1 + tolerance) and seconds - previous > min_delta:
+            regressions.append((name, previous, seconds))
+    for name, previous, seconds in regressions:
+        print(f"slower: {name.strip()} {previous * 1000:.1f} ms -> {seconds * 1000:.1f} ms "
+              f"(+{(seconds / previous - 1) * 100:.0f}%)")
+    if not regressions:
+        print(f"no stage slower than the baseline by more than {tolerance * 100:.0f}%")
+    return bool(regressions)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=30)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--readings-per-month', type=int, default=2)
+    parser.add_argument('--resets', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta-ms', type=float, default=2)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    sources = generate_sources(meters=args.meters, years=args.years, readings_per_month=args.readings_per_month,
+                               resets=args.resets)
+    with tempfile.TemporaryDirectory() as directory:
+        # Measure the preparation, the snapshot store is measured on its own.
+        csv_arguments = dict(write_sources(sources, directory), snapshot_dir=None)
+        fetcher, stages = fetcher_stages(csv_arguments, args.repeat)
+        stages.update(preparation_stages(sources, args.repeat))
+        serialization, json_size = serialization_stages(fetcher.snapshot(), args.repeat)
+        stages.update(serialization)
+        stages[f"  snapshot json ({json_size / 1024:.0f} kB)"] = (None, None)
+        stages.update(callback_stages(csv_arguments, args.repeat))
+
+    print(f"{len(sources['contracts'])} contracts, {len(sources['measurements'])} readings, "
+          f"{len(fetcher.measurements_df)} daily rows")
+    report(stages)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({name: list(values) for name, values in stages.items()}, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            if compare(stages, json.load(file), args.tolerance, args.min_delta_ms / 1000):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
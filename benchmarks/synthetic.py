@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utilities.data.utility_data import UtilityData
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+METER_TYPES = [
+    ('Electricity', 'kWh', 8.0),
+    ('Gas', 'm3', 2.0),
+    ('Heating', 'mWh', 0.01)
+]
+
+
+def generate_sources(meters=3, years=4, readings_per_month=2, resets=1, anexes_per_contract=2, seed=0):
+    """
+    Generate the six utility sources in the schema of the HomeExpenses CSVs.
+
+    Every meter gets one contract per year, the last one running until the end of the current year. Readings are
+    spread randomly over every contract, old contracts have a reading on their first and last day, and `resets` readings
+    per meter restart the counter at 0.
+    """
+    rng = np.random.default_rng(seed)
+    first_year = pd.Timestamp.now().year - years + 1
+    contracts, measurements, anexes, payment_plan, settlements, bonuses = [], [], [], [], [], []
+    contract_number = 0
+    for meter in range(meters):
+        meter_type, unit, daily_consumption = METER_TYPES[meter % len(METER_TYPES)]
+        address = f"Street {meter // len(METER_TYPES) + 1}"
+        value = float(rng.integers(100, 1000)) * daily_consumption
+        meter_readings = []
+        for year in range(first_year, first_year + years):
+            contract_number += 1
+            contract_id = f"C{contract_number:05d}"
+            start = pd.Timestamp(year, 1, 1) + pd.Timedelta(days=int(rng.integers(0, 20)))
+            end = pd.Timestamp(year + 1, 1, 1) + pd.Timedelta(days=int(rng.integers(0, 20)) - 1)
+            contracts.append({
+                'ID': contract_id,
+                'Type': meter_type,
+                'Address': address,
+                'ContractName': f"{meter_type} {address} {year}",
+                'ContractYear': year,
+                'From': start,
+                'To': end
+            })
+
+            days = (end - start).days + 1
+            bounds = np.linspace(0, days, anexes_per_contract + 1).astype(int)
+            for anex in range(anexes_per_contract):
+                anexes.append({
+                    'AnexID': f"{contract_id}-A{anex}",
+                    'ContractID': contract_id,
+                    'AnexStart': start + pd.Timedelta(days=int(bounds[anex])),
+                    'AnexEnd': start + pd.Timedelta(days=int(bounds[anex + 1]) - 1),
+                    'Price/Unit': round(float(rng.uniform(0.05, 0.4)), 4),
+                    'YearlyBasePrice': round(float(rng.uniform(50, 200)), 2),
+                    'VAT%': 19
+                })
+
+            for month in range(12):
+                payment_plan.append({
+                    'PaymentID': f"{contract_id}-P{month}",
+                    'ContractID': contract_id,
+                    'PaymentDate': start + pd.DateOffset(months=month),
+                    'PaymentAmount': round(float(rng.uniform(30, 120)), 2)
+                })
+            settlements.append({
+                'SettlementID': f"{contract_id}-S",
+                'ContractID': contract_id,
+                'SettlementDate': end + pd.Timedelta(days=30),
+                'SettlementAmount': round(float(rng.uniform(-100, 100)), 2)
+            })
+            bonuses.append({
+                'BonusID': f"{contract_id}-B",
+                'ContractID': contract_id,
+                'BonusDate': start + pd.Timedelta(days=60),
+                'BonusAmount': 50.0
+            })
+
+            reading_days = np.sort(rng.choice(days, size=min(readings_per_month * 12, days), replace=False))
+            if year < first_year + years - 1:
+                reading_days[0], reading_days[-1] = 0, days - 1
+            previous_day = 0
+            for day in reading_days:
+                value += daily_consumption * (day - previous_day) * float(rng.uniform(0.5, 1.5))
+                previous_day = day
+                meter_readings.append({
+                    'date': start + pd.Timedelta(days=int(day)),
+                    'contract': contract_id,
+                    'aggregate_consumption': value,
+                    'measure_unit': unit
+                })
+
+        readings = pd.DataFrame(meter_readings)
+        for reset in rng.choice(np.arange(1, len(readings)), size=min(resets, len(readings) - 1), replace=False):
+            readings.loc[reset:, 'aggregate_consumption'] -= readings.at[reset, 'aggregate_consumption']
+        readings['aggregate_consumption'] = readings['aggregate_consumption'].round(2)
+        measurements.append(readings)
+
+    return {
+        'measurements': pd.concat(measurements, ignore_index=True),
+        'contracts': pd.DataFrame(contracts),
+        'contract_anex': pd.DataFrame(anexes),
+        'contract_payment_plan': pd.DataFrame(payment_plan),
+        'contract_settlement': pd.DataFrame(settlements),
+        'contract_bonus': pd.DataFrame(bonuses)
+    }
+
+
+def write_sources(sources: dict, directory: str) -> dict:
+    """Write generated sources as CSV files and return the UtilityDataFetcherCSV arguments reading them."""
+    os.makedirs(directory, exist_ok=True)
+    arguments = {}
+    for name, df in sources.items():
+        path = os.path.join(directory, f"{name}.csv")
+        df.to_csv(path, index=False)
+        arguments[f"{name}_source"] = path
+    return arguments
+
+
+def generate_utility_data(**kwargs) -> UtilityData:
+    """Generate sources and prepare them the same way UtilityDataFetcherCSV does."""
+    sources = generate_sources(**kwargs)
+    measurements_df = UtilityDataFetcherCSV.compact_measurements(UtilityDataFetcherCSV.sort_measurements(
+        UtilityDataFetcherCSV.prepare_data(sources['measurements'], sources['contracts'], sources['contract_anex'])))
+    return UtilityData(
+        measurements_df,
+        sources['contracts'],
+        sources['contract_anex'],
+        UtilityDataFetcherCSV.compact_payment_plan(UtilityDataFetcherCSV.prepare_payment_plan(
+            sources['contract_payment_plan'], sources['contract_settlement'], sources['contracts'])),
+        sources['contract_settlement'],
+        sources['contract_bonus'],
+        UtilityDataFetcherCSV.rollup_measurements(measurements_df)
+    )
@@ -0,0 +1,43 @@
+"""
+Serving the dashboard with gunicorn: `gunicorn -c gunicorn.conf.py`.
+
+Several worker processes with a few threads each, so one slow figure does not hold up the other clients. The app is
+imported once in the master, which prepares the utility data, publishes it and prewarms the figures before the
+workers start, so the workers share them copy-on-write. One worker leads the snapshot store: it fetches the sources
+and stores what it prepared, the other workers only load the stored snapshots (see SnapshotStore), so the sources
+are requested as often as with a single process. Figures built later are cached per worker, and /metrics reports the
+worker that serves the scrape.
+
+Whether this serves more requests than `python app.py` depends on the cores of the machine, measure it there with
+benchmarks.load before switching the service over.
+
+WEB_CONCURRENCY, GUNICORN_THREADS and GUNICORN_BIND override the defaults below, as do the gunicorn command line
+options.
+"""
+import logging
+import multiprocessing
+import os
+
+wsgi_app = 'app:server'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+# The first refresh of a worker may still prepare the data when the store could not be filled.
+timeout = 120
+
+
+def on_starting(server):
+    # Only the workers serve requests and refresh the data in the background, the master prepares the first snapshot
+    # for all of them.
+    from app import utilities_module
+    cache = utilities_module.utility_data_cache
+    try:
+        cache.refresh()
+        utilities_module.utility_figure_cache.join_prewarm()
+    except Exception:
+        logging.getLogger(__name__).exception("Preparing the utility data before starting the workers failed")
+    finally:
+        # The workers keep the fetcher, but must not share its HTTP connections, and one of them takes the lead.
+        if cache.fetcher is not None:
+            cache.fetcher.close()
@@ -1,9 +1,15 @@
 from dash import Dash
 
+from klupps_snapshot_registry import SnapshotCache, SnapshotRegistry, default_registry
+
 
 class DashModule:
-    def __init__(self):
-        pass
+    def __init__(self, registry: SnapshotRegistry = None):
+        self.registry = registry if registry is not None else default_registry
+
+    def register_snapshot(self, name: str, cache: SnapshotCache) -> SnapshotCache:
+        """Register the module's data with the shared registry, which refreshes it in the background."""
+        return self.registry.register(name, cache)
 
     def is_available(self) -> bool:
         pass
@@ -0,0 +1,170 @@
+import json
+import logging
+import math
+import numbers
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger(__name__ + '.trace')
+
+
+class Metrics:
+    """
+    Process wide counters, gauges and timings, served in the Prometheus text format.
+
+    Timings and sizes are summaries (count and sum) with a `_max` gauge next to them. Collectors added with
+    `add_collector` are called on every scrape and return `(name, type, labels, value)` tuples for values that are
+    cheaper to read than to keep up to date, like the age of a snapshot.
+
+    With request tracing enabled every Flask request is logged as one JSON line with its duration, response size and
+    the timings observed on the request's thread while it was served.
+    """
+
+    def __init__(self):
+        self.summaries = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total, maximum = self.summaries.get(key, (0, 0.0, value))
+            self.summaries[key] = (count + 1, total + value, max(maximum, value))
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.append(dict(labels, metric=name, value=round(value, 6)))
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        samples = {}
+        with self._lock:
+            for (name, labels), (count, total, maximum) in self.summaries.items():
+                metric = samples.setdefault(name, ('summary', []))[1]
+                metric.append((f"{name}_count", labels, count))
+                metric.append((f"{name}_sum", labels, total))
+                samples.setdefault(f"{name}_max", ('gauge', []))[1].append((f"{name}_max", labels, maximum))
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, ('counter', []))[1].append((name, labels, value))
+            for (name, labels), value in self.gauges.items():
+                samples.setdefault(name, ('gauge', []))[1].append((name, labels, value))
+        for collector in self.collectors:
+            try:
+                for name, metric_type, labels, value in collector():
+                    samples.setdefault(name, (metric_type, []))[1].append(
+                        (name, tuple(sorted(labels.items())), value))
+            except Exception:
+                logger.exception("Collecting metrics from %s failed", collector)
+
+        lines = []
+        for name, (metric_type, metric_samples) in sorted(samples.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in metric_samples:
+                lines.append(f"{sample_name}{Metrics._labels(labels)} {Metrics._value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def init_app(self, server, trace_requests: bool = False):
+        """
+        Serve the metrics on `/metrics` of the Flask `server` and time every request, Dash callbacks by their output.
+
+        With `trace_requests` every request is logged as JSON on the `klupps_metrics.trace` logger.
+        """
+        from flask import g, request, Response
+
+        @server.before_request
+        def start_request():
+            g.metrics_start = time.perf_counter()
+            self._local.trace = [] if trace_requests else None
+
+        @server.after_request
+        def finish_request(response):
+            if not hasattr(g, 'metrics_start'):
+                return response
+            seconds = time.perf_counter() - g.metrics_start
+            trace, self._local.trace = self._local.trace, None
+            size = response.calculate_content_length() or 0
+            if request.path.endswith('/_dash-update-component'):
+                body = request.get_json(silent=True) or {}
+                output = body.get('output', '')
+                self.observe('dash_callback_seconds', seconds, output=output)
+                self.observe('dash_callback_response_bytes', size, output=output)
+            else:
+                output = None
+                # Labelled by route, not by URL, so requests for paths that do not exist share one series.
+                rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+                self.observe('http_request_seconds', seconds, path=rule)
+            if trace_requests:
+                trace_logger.info(json.dumps({
+                    'path': request.path,
+                    'output': output,
+                    'status': response.status_code,
+                    'seconds': round(seconds, 6),
+                    'bytes': size,
+                    'stages': trace
+                }))
+            return response
+
+        def metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        server.add_url_rule('/metrics', 'metrics', metrics)
+
+    @staticmethod
+    def _value(value) -> str:
+        """Integers exactly, e.g. large counters and versions, floats with all their digits."""
+        if isinstance(value, numbers.Integral):
+            return str(int(value))
+        value = float(value)
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+
+    @staticmethod
+    def _labels(labels: tuple) -> str:
+        if not labels:
+            return ''
+        escaped = [
+            (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in labels
+        ]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+# Metrics of the whole process, the modules report into these.
+default_metrics = Metrics()
+default_metrics.describe('dash_callback_seconds', "Time to serve a Dash callback, by output")
+default_metrics.describe('dash_callback_response_bytes', "Size of Dash callback responses, by output")
+default_metrics.describe('snapshot_refresh_seconds', "Time of snapshot refreshes, by snapshot")
+default_metrics.describe('snapshot_age_seconds', "Seconds since the snapshot was last refreshed")
+default_metrics.describe('snapshot_memory_bytes', "Bytes held by the kept versions of the snapshot")
@@ -0,0 +1,257 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from klupps_metrics import default_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    """
+    Process wide cache of the data of one dashboard module.
+
+    The data comes from a fetcher created by `fetcher_factory`. A fetcher loads its sources when it is created, and
+    has a `refresh()` returning whether its sources changed and a `snapshot()` returning the current data as an
+    immutable object, later refreshes of the fetcher must not change a snapshot it returned.
+
+    Readers only get published snapshots, every snapshot gets a new version and the last `keep_versions` are kept,
+    clients may still ask for the one they got before a refresh. Versions count up, unless the fetcher has a
+    `snapshot_version()` method deriving them from the content, which keeps them the same in every worker process
+    serving the same data. A refresh is single flight: callers that find the data
+    stale while another refresh is running wait for it and reuse its result. The version only moves when the fetcher
+    reports that its sources changed. Registered in a SnapshotRegistry, the data is refreshed in the background every
+    `ttl` seconds by the registry's refresher thread, and right away when a fetcher with a `sources_modified()` method
+    reports a change in between.
+    """
+
+    def __init__(self, fetcher_factory, ttl: float = 300, keep_versions: int = 3):
+        self.fetcher_factory = fetcher_factory
+        self.ttl = ttl
+        self.keep_versions = keep_versions
+        self.name = None
+        self.registry = None
+        self.fetcher = None
+        self.data = None
+        self.version = 0
+        self.snapshots = OrderedDict()
+        # Called with the version and the snapshot whenever a new snapshot is published.
+        self.listeners = []
+        self.refreshed_at = None
+        # Wall clock time of the last successful refresh, the data is current as of then.
+        self.checked_at = None
+        self._refresh_lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the current snapshot. Registered caches only refresh on the caller's thread while they have no data
+        yet, stale data is returned right away and refreshed in the background.
+        """
+        if self.registry is not None:
+            self.registry.start()
+        if self.is_stale() and (self.data is None or self.registry is None):
+            self.refresh()
+        return self.data
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def resolve_version(self, version: int) -> int:
+        """Return the version get_version(version) resolves to."""
+        if version in self.snapshots:
+            return version
+        self.get()
+        return self.version
+
+    def get_version(self, version: int):
+        """Return the snapshot with the given version, or the current one if that version is no longer kept."""
+        data = self.snapshots.get(version)
+        if data is None:
+            return self.get()
+        return data
+
+    def is_stale(self) -> bool:
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.ttl
+
+    def due_in(self) -> float:
+        """Seconds until the data gets stale."""
+        if self.refreshed_at is None:
+            return 0
+        return max(self.ttl - (time.monotonic() - self.refreshed_at), 0)
+
+    def sources_modified(self) -> bool:
+        """Whether the fetcher detected a change of its sources without refreshing, False if it cannot tell."""
+        fetcher = self.fetcher
+        if fetcher is None or not hasattr(fetcher, 'sources_modified'):
+            return False
+        return fetcher.sources_modified()
+
+    def invalidate(self):
+        """Mark the data stale, the next read or background pass refreshes it."""
+        self.refreshed_at = None
+
+    def refresh(self, force: bool = False):
+        with self._refresh_lock:
+            # Somebody else refreshed the data while we were waiting for the lock.
+            if not force and not self.is_stale():
+                return self.data
+            start = time.perf_counter()
+            try:
+                if self.fetcher is None:
+                    self.fetcher = self.fetcher_factory()
+                    changed = True
+                else:
+                    changed = self.fetcher.refresh()
+            except Exception:
+                default_metrics.inc('snapshot_refresh_failures_total', snapshot=self.name)
+                if self.data is None:
+                    raise
+                logger.exception("Refreshing snapshot %s failed, keeping version %d", self.name, self.version)
+                # Do not retry on every read, wait for the next scheduled refresh.
+                self.refreshed_at = time.monotonic()
+                return self.data
+            default_metrics.observe('snapshot_refresh_seconds', time.perf_counter() - start, snapshot=self.name,
+                                    changed=str(changed).lower())
+            if changed:
+                self.data = self.fetcher.snapshot()
+                self.version = self._next_version()
+                self.snapshots[self.version] = self.data
+                self.snapshots.move_to_end(self.version)
+                while len(self.snapshots) > self.keep_versions:
+                    self.snapshots.popitem(last=False)
+                for listener in self.listeners:
+                    listener(self.version, self.data)
+            self.refreshed_at = time.monotonic()
+            self.checked_at = time.time()
+            return self.data
+
+    def _next_version(self) -> int:
+        if hasattr(self.fetcher, 'snapshot_version'):
+            return self.fetcher.snapshot_version()
+        return self.version + 1
+
+    def memory_usage(self) -> int:
+        """
+        Bytes held by the kept snapshots.
+
+        Snapshots with a `memory_usage(seen)` method report themselves and skip the objects in `seen`, so data shared
+        between versions is only counted once. Other snapshots are counted with sys.getsizeof.
+        """
+        seen = set()
+        total = 0
+        for data in list(self.snapshots.values()):
+            if hasattr(data, 'memory_usage'):
+                total += data.memory_usage(seen)
+            elif id(data) not in seen:
+                seen.add(id(data))
+                total += sys.getsizeof(data)
+        return total
+
+
+class SnapshotRegistry:
+    """
+    Snapshot caches of all dashboard modules in the process.
+
+    One background thread refreshes every registered cache when it gets stale, so N cards do not each run their own
+    polling. Listeners added to the registry are called with the name, version and snapshot of every cache that
+    publishes a new snapshot, which is the common signal for modules to drop data derived from older versions.
+    `invalidate` makes caches refresh right away, e.g. after a source was edited.
+
+    Between refreshes the thread checks every `watch_interval` seconds whether the fetchers saw their sources change,
+    e.g. a local CSV file being written, so clients polling the versions see new data within seconds instead of after
+    the next `ttl`.
+    """
+
+    def __init__(self, watch_interval: float = 5):
+        self.watch_interval = watch_interval
+        self.caches = OrderedDict()
+        self.listeners = []
+        # (name, version) -> memory usage, measuring it walks all frames.
+        self._memory_usage = {}
+        self._start_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def register(self, name: str, cache: SnapshotCache) -> SnapshotCache:
+        if name in self.caches:
+            raise ValueError(f"A snapshot named {name} is already registered")
+        cache.name = name
+        cache.registry = self
+        cache.add_listener(lambda version, data: self._publish(name, version, data))
+        self.caches[name] = cache
+        return cache
+
+    def get(self, name: str) -> SnapshotCache:
+        return self.caches[name]
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def invalidate(self, name: str = None):
+        """Mark the cache `name`, or all caches, stale and wake the refresher."""
+        for cache_name, cache in self.caches.items():
+            if name is None or cache_name == name:
+                cache.invalidate()
+        self._wake_event.set()
+
+    def init_app(self, server):
+        """Start the background refresh with the first request of the Flask `server`."""
+        # Start loading the data with the first request, e.g. for the layout, before any callback asks for it.
+        server.before_request(self.start)
+
+    def collect(self):
+        """Version, age and memory of every cache, as a Metrics collector."""
+        for name, cache in list(self.caches.items()):
+            labels = {'snapshot': name}
+            yield 'snapshot_version', 'gauge', labels, cache.version
+            if cache.refreshed_at is not None:
+                yield 'snapshot_age_seconds', 'gauge', labels, time.monotonic() - cache.refreshed_at
+            key = (name, cache.version)
+            if key not in self._memory_usage:
+                self._memory_usage = {
+                    cached: usage for cached, usage in self._memory_usage.items() if cached[0] != name
+                }
+                self._memory_usage[key] = cache.memory_usage()
+            yield 'snapshot_memory_bytes', 'gauge', labels, self._memory_usage[key]
+
+    def start(self):
+        """Start the background refresh. The thread is started lazily so only the serving process runs it."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._start_lock:
+            self._stop_event.set()
+            self._wake_event.set()
+            self._thread = None
+
+    def _publish(self, name: str, version: int, data):
+        logger.info("Published snapshot %s version %d", name, version)
+        for listener in self.listeners:
+            listener(name, version, data)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            for name, cache in list(self.caches.items()):
+                try:
+                    if cache.is_stale():
+                        cache.refresh()
+                    elif cache.sources_modified():
+                        logger.info("Sources of snapshot %s changed", name)
+                        cache.refresh(force=True)
+                except Exception:
+                    logger.exception("Refreshing snapshot %s failed", name)
+            waits = [cache.due_in() for cache in self.caches.values() if cache.refreshed_at is not None]
+            self._wake_event.wait(max(min(waits + [self.watch_interval]), 1))
+
+
+# Registry the dashboard modules share unless they are given their own.
+default_registry = SnapshotRegistry()
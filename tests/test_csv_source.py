@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.synthetic import generate_sources, write_sources
+from utilities.data.csv_source import CSVSource
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    """Serves the files of a directory, answers If-Modified-Since with 304 and records the status codes sent."""
+
+    def log_request(self, code='-', size='-'):
+        self.server.statuses.append(int(code))
+
+
+@pytest.fixture
+def server(tmp_path):
+    served_dir = tmp_path / 'served'
+    served_dir.mkdir()
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), partial(RecordingHandler, directory=str(served_dir)))
+    http_server.statuses = []
+    http_server.url = f"http://127.0.0.1:{http_server.server_address[1]}"
+    http_server.sources = write_sources(generate_sources(meters=2, years=2), str(served_dir))
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def remote_sources(server) -> dict:
+    return {argument: f"{server.url}/{os.path.basename(path)}" for argument, path in server.sources.items()}
+
+
+def test_first_fetch_writes_the_mirror_and_its_metadata(server, tmp_path):
+    source = CSVSource(remote_sources(server)['measurements_source'], str(tmp_path / 'mirror'))
+    assert source.fetch()
+    assert server.statuses == [200]
+
+    with open(source.path, 'rb') as mirror, open(server.sources['measurements_source'], 'rb') as served:
+        assert mirror.read() == served.read()
+    with open(source.meta_path) as file:
+        meta = json.load(file)
+    assert meta['url'] == source.url
+    assert meta['last_modified']
+    assert meta['sha256'] == source.digest
+
+
+def test_unchanged_sources_are_not_parsed_again(server, tmp_path):
+    fetcher = UtilityDataFetcherCSV(**remote_sources(server), mirror_dir=str(tmp_path / 'mirror'), snapshot_dir=None)
+    server.statuses.clear()
+
+    assert not fetcher.refresh()
+    assert server.statuses == [304] * len(fetcher.sources)
+    assert all(list(fetcher.source_timings[name]) == ['fetch'] for name in fetcher.sources)
+
+
+def test_mirror_is_used_when_the_server_is_down(server, tmp_path):
+    url = remote_sources(server)['contracts_source']
+    mirror_dir = str(tmp_path / 'mirror')
+    assert CSVSource(url, mirror_dir).fetch()
+    server.shutdown()
+    server.server_close()
+
+    source = CSVSource(url, mirror_dir, timeout=1, retries=0)
+    assert source.fetch()
+    with open(source.path, 'rb') as mirror, open(server.sources['contracts_source'], 'rb') as served:
+        assert mirror.read() == served.read()
+    assert not source.fetch()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from benchmarks import legacy
+from benchmarks.synthetic import generate_sources
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def test_matches_resampling_when_contracts_have_edge_readings():
+    # The synthetic contracts have readings on their first and last day, so no edge reaches into another contract.
+    sources = generate_sources(meters=4, years=3, resets=1)
+    readings = UtilityDataFetcherCSV.prepare_readings(sources['measurements'], sources['contracts'])
+    assert_frame_equal(UtilityDataFetcherCSV.interpolate_daily(readings, sources['contracts']),
+                       legacy.resample_interpolate(readings, sources['contracts']), check_exact=True)
+
+
+def test_edge_days_are_interpolated_from_the_same_meter():
+    # C3 continues meter A after C1 but has no reading on its first days, C2 of meter B lies between them by ID.
+    contracts = pd.DataFrame({
+        'ID': ['C1', 'C2', 'C3'],
+        'Type': ['Electricity', 'Electricity', 'Electricity'],
+        'Address': ['A', 'B', 'A'],
+        'From': pd.to_datetime(['2020-01-01', '2020-01-01', '2020-01-11']),
+        'To': pd.to_datetime(['2020-01-10', '2020-01-10', '2020-01-20']),
+    })
+    readings = pd.DataFrame({
+        'date': pd.to_datetime(['2020-01-01', '2020-01-01', '2020-01-10', '2020-01-10', '2020-01-13', '2020-01-15',
+                                '2020-01-20']),
+        'contract': ['C1', 'C2', 'C1', 'C2', 'C3', 'C3', 'C3'],
+        'aggregate_consumption': [0.0, 1000.0, 90.0, 1900.0, np.nan, 140.0, 190.0],
+    })
+
+    actual = UtilityDataFetcherCSV.interpolate_daily(readings, contracts)
+    expected = legacy.resample_interpolate(readings, contracts)
+    assert_frame_equal(actual[['contract', 'date']], expected[['contract', 'date']])
+
+    # Within the readings of every contract both agree.
+    c3 = actual['contract'] == 'C3'
+    interior = ~c3 | (actual['date'] >= '2020-01-15')
+    assert_frame_equal(actual[interior], expected[interior], check_exact=True)
+
+    # Before its first reading C3 continues from the last reading of C1, the resampling from the last one of C2.
+    edge = c3 & (actual['date'] < '2020-01-15')
+    assert actual.loc[edge, 'aggregate_consumption'].tolist() == [100.0, 110.0, 120.0, 130.0]
+    assert expected.loc[edge, 'aggregate_consumption'].tolist() != [100.0, 110.0, 120.0, 130.0]
@@ -0,0 +1,47 @@
+import logging
+import os
+import time
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from benchmarks.incremental import append_reading, change_anex_price, correct_old_reading, remove_contract
+from benchmarks.synthetic import generate_sources, write_sources
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def without_first_readings(sources):
+    # The first days of every contract are interpolated from the last reading of the previous contract of the meter.
+    measurements = sources['measurements']
+    sources['measurements'] = measurements.drop(measurements.groupby('contract')['date'].idxmin()) \
+        .reset_index(drop=True)
+
+
+def correct_edge_reading(sources):
+    # Only the readings of the first contract change, the series of the next contract of the meter depends on them.
+    measurements = sources['measurements']
+    measurements.loc[measurements.groupby('contract')['date'].idxmax().iloc[0], 'aggregate_consumption'] += 10
+
+
+@pytest.mark.parametrize('change', [append_reading, correct_old_reading, change_anex_price, remove_contract,
+                                    correct_edge_reading])
+def test_incremental_refresh_matches_full_preparation(tmp_path, caplog, change):
+    sources = generate_sources(meters=4, years=3)
+    without_first_readings(sources)
+    arguments = write_sources(sources, str(tmp_path))
+    fetcher = UtilityDataFetcherCSV(**arguments, incremental=True, snapshot_dir=None)
+
+    change(sources)
+    write_sources(sources, str(tmp_path))
+    for path in arguments.values():
+        os.utime(path, ns=(time.time_ns(), time.time_ns()))
+    with caplog.at_level(logging.INFO, logger='utilities.data.utility_data_fetcher_csv'):
+        assert fetcher.refresh()
+
+    frames = fetcher.source_frames
+    full = UtilityDataFetcherCSV.compact_measurements(UtilityDataFetcherCSV.sort_measurements(
+        UtilityDataFetcherCSV.prepare_data(frames['measurements'], frames['contracts'], frames['contract_anex'])))
+    assert_frame_equal(fetcher.measurements_df, full, check_exact=True)
+    # Only the changed contracts were rebuilt.
+    rebuilt = [record.args for record in caplog.records if record.msg.startswith("Incremental preparation rebuilt")]
+    assert rebuilt and rebuilt[-1][0] < rebuilt[-1][1]
@@ -0,0 +1,55 @@
+import pandas as pd
+from pandas.testing import assert_series_equal
+
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def readings(rows):
+    df = pd.DataFrame(rows, columns=['date', 'TypeAddress', 'aggregate_consumption'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def test_restarts_continue_from_the_previous_reading():
+    # Meter A restarts twice, the offsets add up. Meter B starts at 0, which is not a restart, and restarts once.
+    df = readings([
+        ('2022-01-01', 'A', 10.0),
+        ('2022-01-02', 'B', 0.0),
+        ('2022-01-03', 'A', 20.0),
+        ('2022-01-04', 'B', 7.0),
+        ('2022-01-05', 'A', 0.0),
+        ('2022-01-06', 'B', 0.0),
+        ('2022-01-07', 'A', 5.0),
+        ('2022-01-08', 'A', 0.0),
+        ('2022-01-09', 'B', 2.0),
+        ('2022-01-10', 'A', 3.0),
+    ])
+    assert_series_equal(
+        UtilityDataFetcherCSV.continue_restarted_meters(df),
+        pd.Series([10.0, 0.0, 20.0, 7.0, 20.0, 7.0, 25.0, 25.0, 9.0, 28.0], name='aggregate_consumption')
+    )
+
+
+def test_meters_without_restarts_are_unchanged():
+    df = readings([
+        ('2022-01-01', 'A', 1.5),
+        ('2022-01-02', 'B', 3.0),
+        ('2022-01-03', 'A', 2.5),
+        ('2022-01-04', 'B', 4.0),
+    ])
+    assert_series_equal(UtilityDataFetcherCSV.continue_restarted_meters(df), df['aggregate_consumption'])
+
+
+def test_restart_after_a_restart_on_the_first_reading():
+    # A first reading of 0 is the start of the meter, a later 0 right after it adds an offset of 0.
+    df = readings([
+        ('2022-01-01', 'A', 0.0),
+        ('2022-01-02', 'A', 0.0),
+        ('2022-01-03', 'A', 4.0),
+        ('2022-01-04', 'A', 0.0),
+        ('2022-01-05', 'A', 1.0),
+    ])
+    assert_series_equal(
+        UtilityDataFetcherCSV.continue_restarted_meters(df),
+        pd.Series([0.0, 0.0, 4.0, 4.0, 5.0], name='aggregate_consumption')
+    )
@@ -0,0 +1,60 @@
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from benchmarks.synthetic import generate_sources, write_sources
+from utilities.data.snapshot_store import SnapshotStore
+from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+
+
+def test_unchanged_sources_are_prepared_again_once_a_contract_ended(tmp_path):
+    sources = generate_sources(meters=2, years=2)
+    fetcher = UtilityDataFetcherCSV(**write_sources(sources, str(tmp_path)), snapshot_dir=None)
+    contracts = sources['contracts']
+    assert fetcher.valid_until == contracts.loc[contracts['To'] >= pd.Timestamp.now(), 'To'].min()
+    assert not fetcher.refresh()
+
+    # The next contract ended since the last refresh.
+    fetcher.valid_until = pd.Timestamp.now() - pd.Timedelta(days=1)
+    previous = fetcher.measurements_df
+    assert fetcher.refresh()
+    assert 'prepare_data' in fetcher.source_timings
+    assert fetcher.measurements_df is not previous
+    assert fetcher.valid_until > pd.Timestamp.now()
+    assert not fetcher.refresh()
+
+
+def test_snapshot_key_depends_on_the_end_of_the_next_contract():
+    digests = {'measurements': 'a', 'contracts': 'b'}
+    assert SnapshotStore.key(digests, 1, pd.Timestamp('2024-01-31')) != \
+        SnapshotStore.key(digests, 1, pd.Timestamp('2025-01-31'))
+
+
+def test_only_the_leading_process_fetches_the_sources(tmp_path):
+    sources = generate_sources(meters=2, years=2)
+    arguments = write_sources(sources, str(tmp_path))
+    snapshot_dir = str(tmp_path / 'snapshots')
+    leader = UtilityDataFetcherCSV(**arguments, snapshot_dir=snapshot_dir)
+    follower = UtilityDataFetcherCSV(**arguments, snapshot_dir=snapshot_dir)
+    assert list(follower.source_timings) == ['snapshot_store']
+    assert follower.snapshot_version() == leader.snapshot_version()
+
+    sources['measurements'].loc[0, 'aggregate_consumption'] += 1
+    write_sources(sources, str(tmp_path))
+    # The follower neither watches nor fetches the sources, it waits for the leader to store the new data.
+    assert not follower.sources_modified()
+    assert not follower.refresh()
+    assert leader.sources_modified()
+    assert leader.refresh()
+    assert follower.sources_modified()
+    assert follower.refresh()
+    assert list(follower.source_timings) == ['snapshot_store']
+    assert follower.snapshot_version() == leader.snapshot_version()
+    assert_frame_equal(follower.measurements_df, leader.measurements_df)
+
+    # Once the leader is gone the follower takes over.
+    leader.close()
+    sources['measurements'].loc[0, 'aggregate_consumption'] += 1
+    write_sources(sources, str(tmp_path))
+    assert follower.refresh()
+    assert 'prepare_data' in follower.source_timings
+    assert follower.snapshot_version() != leader.snapshot_version()
@@ -0,0 +1,28 @@
+import pytest
+
+from benchmarks.synthetic import generate_utility_data
+from utilities.utility_figures import GRANULARITIES, GRAPH_TYPES, create_line_plot
+
+
+@pytest.fixture(scope='module')
+def utility_data():
+    return generate_utility_data(meters=3, years=3)
+
+
+def visible(trace) -> bool:
+    """Whether a trace draws anything: a line needs two points, markers show single points."""
+    points = sum(x is not None for x in trace.x)
+    return points >= 2 or (points == 1 and 'markers' in trace.mode)
+
+
+@pytest.mark.parametrize('granularity', list(GRANULARITIES))
+@pytest.mark.parametrize('graph_type', GRAPH_TYPES)
+def test_every_granularity_draws_every_contract(utility_data, granularity, graph_type):
+    for utility_type in utility_data.index.types:
+        contracts = utility_data.index.contracts(utility_type)
+        years = contracts.ContractYear
+        fig = create_line_plot(utility_data, utility_type, [int(years.min()), int(years.max())], graph_type, None,
+                               granularity=granularity)
+        traces = [trace for trace in fig.data if len(trace.x)]
+        assert {trace.legendgroup.split(',')[0] for trace in traces} >= set(contracts.ID)
+        assert all(visible(trace) for trace in traces)
@@ -1,6 +1,16 @@
+import json
+from importlib.resources import files
+
 import dash_bootstrap_components as dbc
 
 template_theme1 = "darkly"
 template_theme2 = "flatly"
 url_theme1 = dbc.themes.DARKLY
-url_theme2 = dbc.themes.FLATLY
\ No newline at end of file
+url_theme2 = dbc.themes.FLATLY
+
+
+def figure_template(theme: str) -> dict:
+    """The plotly figure template of a bootstrap theme as plain JSON, without registering it with plotly."""
+    with (files("dash_bootstrap_templates") / "templates" / f"{theme}.json").open() as file:
+        return json.load(file)
+
@@ -1,22 +1,29 @@
-import pandas as pd
+from datetime import datetime
+from functools import partial
+
 from aio import ThemeSwitchAIO
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, dcc, html, Input, Output, State, no_update
 import dash_bootstrap_components as dbc
-import plotly.express as px
-import plotly.graph_objects as go
 
-from theme import template_theme1, template_theme2
-import numpy as np
+from theme import figure_template, template_theme1, template_theme2
 
 from klupps_dash_model import DashModule
+from klupps_snapshot_registry import SnapshotRegistry
 
 from utilities.data.utility_data import UtilityData
 from utilities.data.utility_data_fetcher_csv import UtilityDataFetcherCSV
+from utilities.data.utility_data_cache import UtilityDataCache
+from utilities.utility_figures import GRANULARITIES, UtilityFigureCache, point_budget
 
 
 class UtilitiesModule(DashModule):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, refresh_interval: float = 300, registry: SnapshotRegistry = None):
+        super().__init__(registry)
+        self.utility_data_cache = self.register_snapshot(
+            'utilities',
+            UtilityDataCache(partial(UtilityDataFetcherCSV, incremental=True), ttl=refresh_interval)
+        )
+        self.utility_figure_cache = UtilityFigureCache(self.utility_data_cache)
 
     def is_available(self) -> bool:
         return True
@@ -56,6 +63,17 @@ class UtilitiesModule(DashModule):
             )
         ])
 
+        granularity_chooser = html.Div([
+            dbc.Label("Choose Resolution", html_for="utility_granularity_chooser"),
+            dbc.Select(
+                id='utility_granularity_chooser',
+                options=[
+                    {"label": label, "value": granularity} for granularity, label in GRANULARITIES.items()
+                ],
+                value="D"
+            )
+        ])
+
         slider = html.Div(
             [
                 dbc.Label("Choose Period", html_for="utility_contract_year_chooser"),
@@ -74,26 +92,63 @@ class UtilitiesModule(DashModule):
             id='utility_graph'
         )
 
+        # Width of the graph and the zoomed in x range, the figure is downsampled for these.
+        utility_graph_view_store = dcc.Store(id='utility_graph_view_store')
+
+        # The server only builds the figure, the theme template is applied in the browser.
+        utility_figure_store = dcc.Store(id='utility_figure_store')
+        utility_figure_templates_store = dcc.Store(
+            id='utility_figure_templates_store',
+            data=[figure_template(template_theme1), figure_template(template_theme2)]
+        )
+
+        # Polls quickly until the first snapshot is loaded in the background, then the app wide refresh_interval takes
+        # over.
+        utility_data_loading_interval = dcc.Interval(id='utility_data_loading_interval', interval=1000)
+        utility_data_status = html.Small(id='utility_data_status', className='text-muted')
+
+        # The store only holds the snapshot version, the frames stay on the server in the utility data cache.
         @app.callback(
             Output('utility_data_store', 'data'),
-            Input("refresh_interval", "n_intervals")
+            Output('utility_data_loading_interval', 'disabled'),
+            Input("refresh_interval", "n_intervals"),
+            Input('utility_data_loading_interval', 'n_intervals'),
+            State('utility_data_store', 'data'),
+            State('utility_data_loading_interval', 'disabled')
         )
-        def refresh_utility_data(n_intervals):
-            utility_data = UtilityDataFetcherCSV()
-            utility_data_json = utility_data.to_json(date_format='iso', orient='split')
-            return utility_data_json
+        def refresh_utility_data(n_intervals, n_loading_intervals, version, loading_disabled):
+            # Polled often, so only the versions are compared. The registry loads and refreshes the data in the
+            # background and the browser only asks for figures again when a new snapshot was published. Polls that
+            # change nothing are answered with an empty response.
+            self.registry.start()
+            if self.utility_data_cache.data is None:
+                return no_update, no_update
+            new_version = self.utility_data_cache.version if version != self.utility_data_cache.version else no_update
+            return new_version, no_update if loading_disabled else True
+
+        @app.callback(
+            Output('utility_data_status', 'children'),
+            Input('utility_data_store', 'data')
+        )
+        def update_utility_data_status(version):
+            checked_at = self.utility_data_cache.checked_at
+            if version is None or checked_at is None:
+                return "Loading data..."
+            return f"Data as of {datetime.fromtimestamp(checked_at):%d.%m.%Y %H:%M}"
 
         @app.callback(
             Output('utility_type_chooser', 'options'),
             Output('utility_type_chooser', 'value'),
             Input('utility_data_store', 'data'),
         )
-        def update_utility_type_chooser(utility_data_json):
-            utility_data = UtilityData.from_json(utility_data_json)
+        def update_utility_type_chooser(version):
+            if version is None:
+                return no_update, no_update
+            utility_data = self.utility_data_cache.get_version(version)
 
             options = [
                           {"label": contract_type, "value": contract_type} for contract_type in
-                          utility_data.contracts_df.Type.unique()
+                          utility_data.index.types
                       ]
             value = options[1]['value']
 
@@ -107,95 +162,89 @@ class UtilitiesModule(DashModule):
             Input('utility_data_store', 'data'),
             Input("utility_type_chooser", "value")
         )
-        def update_contract_chooser(utility_data_json, utility_type):
-            utility_data = UtilityData.from_json(utility_data_json)
-            contract_df = utility_data.contracts_df.copy()
-            filtered_df = contract_df[contract_df.Type == utility_type]
-            years = filtered_df.ContractYear.unique()
+        def update_contract_chooser(version, utility_type):
+            if version is None or utility_type is None:
+                return no_update, no_update, no_update, no_update
+            utility_data = self.utility_data_cache.get_version(version)
+            years = utility_data.index.contracts(utility_type).ContractYear.unique()
             return \
                 int(years.min()), \
                 int(years.max()), \
                 [int(years.min()), int(years.max())], \
                 {int(year): str(year) for year in years}
 
+        app.clientside_callback(
+            """
+            function(relayoutData, utilityType, contractPeriod, graphType, granularity, view) {
+                const graph = document.getElementById('utility_graph');
+                const width = graph && graph.offsetWidth ? Math.round(graph.offsetWidth / 100) * 100 : null;
+                const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+                let xRange = view ? view.x_range : null;
+                if (!triggered.includes('utility_graph.relayoutData')) {
+                    xRange = null;
+                } else if (relayoutData && relayoutData['xaxis.autorange']) {
+                    xRange = null;
+                } else if (relayoutData && relayoutData['xaxis.range[0]'] !== undefined) {
+                    xRange = [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']];
+                } else if (relayoutData && relayoutData['xaxis.range']) {
+                    xRange = relayoutData['xaxis.range'];
+                }
+                if (view && view.width === width && JSON.stringify(view.x_range) === JSON.stringify(xRange)) {
+                    return window.dash_clientside.no_update;
+                }
+                return {width: width, x_range: xRange};
+            }
+            """,
+            Output("utility_graph_view_store", "data"),
+            Input("utility_graph", "relayoutData"),
+            Input("utility_type_chooser", "value"),
+            Input("utility_contract_year_chooser", "value"),
+            Input("utility_graph_type_chooser", "value"),
+            Input("utility_granularity_chooser", "value"),
+            State("utility_graph_view_store", "data")
+        )
+
         @app.callback(
-            Output("utility_graph", "figure"),
-            Input(ThemeSwitchAIO.ids.switch("theme"), "value"),
+            Output("utility_figure_store", "data"),
             Input('utility_data_store', 'data'),
             Input("utility_type_chooser", "value"),
             Input("utility_contract_year_chooser", "value"),
-            Input("utility_graph_type_chooser", "value")
+            Input("utility_graph_type_chooser", "value"),
+            Input("utility_granularity_chooser", "value"),
+            Input("utility_graph_view_store", "data")
         )
-        def create_line_plot(toggle, utility_data_json, utility_type, contract_period, utility_graph_type):
-            utility_data = UtilityData.from_json(utility_data_json)
-            template = template_theme1 if toggle else template_theme2
-            measurements_df = utility_data.measurements_df.copy()
-            contracts_df = utility_data.contracts_df.copy()
-            contracts_df = contracts_df[
-                (contracts_df.Type == utility_type) &
-                (contracts_df.ContractYear >= contract_period[0]) &
-                (contracts_df.ContractYear <= contract_period[1])
-            ]
-            c = dict(zip(sorted(contracts_df['ID'].unique()), px.colors.qualitative.G10))
-            measurements_df = measurements_df.merge(contracts_df, left_on='contract', right_on='ID', sort=False)
-            payment_plan_df = utility_data.contract_payment_plan_df.copy()
-            payment_plan_df = payment_plan_df.merge(contracts_df, left_on='ContractID', right_on='ID', sort=False)
-            df = pd.DataFrame(['contract', 'date', 'amount', 'type'])
-            if utility_graph_type == 'Price':
-                unit_type = 'EUR'
-                mdf = measurements_df[['date', 'aggregate_price', 'contract']].copy()
-                mdf.columns = ['date', 'amount', 'contract']
-                mdf['type'] = 'Spent'
-
-                pdf = payment_plan_df[['PaymentDate', 'AggregatePaymentAmount', 'ContractID']].copy()
-                pdf.columns = ['date', 'amount', 'contract']
-                pdf['type'] = 'Payment'
-
-                df = pd.concat([df, mdf, pdf], ignore_index=True)
-            else:
-                unit_type = 'kWh'
-                mdf = measurements_df[['date', 'aggregate_consumption', 'contract']].copy()
-                mdf.columns = ['date', 'amount', 'contract']
-                mdf['type'] = 'Consumed'
-                df = pd.concat([df, mdf], ignore_index=True)
-
-            df['date'] = pd.to_datetime(df['date'])
-            df.sort_values(by='date', inplace=True, ignore_index=True)
-            print(c)
-            fig = px.line(
-                df,
-                x='date',
-                y='amount',
-                color='contract',
-                color_discrete_map=c,
-                title=f"{utility_type} {utility_graph_type} by Contract",
-                hover_data={'amount': ':.2f'},
-                line_dash='type',
-                markers=False,
-                labels={
-                    "date": "",
-                    "amount": f"{unit_type}",
-                    "contract": "Contract",
-                    "type": ""
-                },
-                template=template)
-            fig.update_layout(
-                transition_duration=500,
-                margin_r=0,
-                margin_l=0,
-                legend=dict(
-                    orientation='h'
-                ),
-                title=dict(
-                    xanchor='center', x=0.5
-                )
-            )
+        def create_line_plot(version, utility_type, contract_period, utility_graph_type, granularity, view):
+            if version is None or utility_type is None:
+                return no_update
+            view = view or {}
+            # The rollups are prepared with the snapshot, coarser resolutions only select fewer rows.
+            return self.utility_figure_cache.get(version, utility_type, contract_period, utility_graph_type,
+                                                 point_budget(view.get('width')), view.get('x_range'),
+                                                 granularity or 'D')
 
-            return fig
+        app.clientside_callback(
+            """
+            function(figure, toggle, templates) {
+                if (!figure) {
+                    return window.dash_clientside.no_update;
+                }
+                const layout = Object.assign({}, figure.layout, {template: toggle ? templates[0] : templates[1]});
+                return Object.assign({}, figure, {layout: layout});
+            }
+            """,
+            Output("utility_graph", "figure"),
+            Input("utility_figure_store", "data"),
+            Input(ThemeSwitchAIO.ids.switch("theme"), "value"),
+            State("utility_figure_templates_store", "data")
+        )
 
         return dbc.Card(
             children=[
                 utility_data_store,
+                utility_figure_store,
+                utility_figure_templates_store,
+                utility_graph_view_store,
+                utility_data_loading_interval,
                 dbc.CardBody([
                     dbc.Row([
                         dbc.Col([
@@ -206,7 +255,13 @@ class UtilitiesModule(DashModule):
                         ], width="auto"),
                         dbc.Col([
                             graph_type_chooser
-                        ], width="auto")
+                        ], width="auto"),
+                        dbc.Col([
+                            granularity_chooser
+                        ], width="auto"),
+                        dbc.Col([
+                            utility_data_status
+                        ], width="auto", className="ms-auto align-self-end")
                     ]),
                     dbc.Row([
                         dbc.Col([
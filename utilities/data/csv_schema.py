@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+
+# Erroneous values listed per column in validation errors.
+MAX_REPORTED_VALUES = 5
+
+
+class CSVSchema:
+    """
+    Declared columns of a CSV source: the dtype of every column, the format of its date columns and the columns every
+    row must have a value in.
+
+    Only the declared columns are read, in the declared order, with their types given to the parser instead of
+    inferring them, and dates are parsed with their explicit format instead of guessing it per value. Files are read
+    with the multithreaded Arrow CSV reader when pyarrow is installed and with the pandas C parser otherwise. A file
+    that does not match fails with a ValueError naming the source, the columns and the lines of the offending values.
+    """
+
+    def __init__(self, columns: dict, dates: dict = None, required: list = ()):
+        # Column -> dtype, 'str' for text and 'datetime64[ns]' for the date columns.
+        self.columns = columns
+        # Date column -> strftime format.
+        self.dates = dates or {}
+        self.required = list(required)
+
+    def read(self, path: str, name: str) -> DataFrame:
+        try:
+            if pyarrow is not None:
+                return self._read_arrow(path, name)
+            return self._read_pandas(path, name)
+        except (ValueError, KeyError) as error:
+            # Missing columns or values the parser could not convert, read everything as text to tell which.
+            self._raise_errors(path, name, error)
+            raise
+
+    def _read_arrow(self, path: str, name: str) -> DataFrame:
+        column_types = {
+            column: pyarrow.string() if column in self.dates or dtype == 'str' else
+            pyarrow.from_numpy_dtype(np.dtype(dtype))
+            for column, dtype in self.columns.items()
+        }
+        table = pyarrow.csv.read_csv(path, convert_options=pyarrow.csv.ConvertOptions(
+            column_types=column_types,
+            include_columns=list(self.columns),
+            strings_can_be_null=True
+        ))
+        dates = {
+            column: pyarrow.compute.strptime(table[column], format=date_format, unit='ns', error_is_null=True)
+            for column, date_format in self.dates.items()
+        }
+        # The dates are only converted as text when some are missing or invalid, to report them.
+        if any(dates[column].null_count for column in dates) or \
+                any(table[column].null_count for column in self.required):
+            CSVSchema._raise(path, name, self._errors(table.to_pandas(), {
+                column: values.to_pandas() for column, values in dates.items()
+            }))
+        for column, values in dates.items():
+            table = table.set_column(table.schema.get_field_index(column), column, values)
+        return table.to_pandas()
+
+    def _read_pandas(self, path: str, name: str) -> DataFrame:
+        dtypes = {column: object if column in self.dates or dtype == 'str' else dtype
+                  for column, dtype in self.columns.items()}
+        df = pd.read_csv(path, usecols=list(self.columns), dtype=dtypes)[list(self.columns)]
+        dates = {
+            column: pd.to_datetime(df[column], format=date_format, errors='coerce')
+            for column, date_format in self.dates.items()
+        }
+        CSVSchema._raise(path, name, self._errors(df, dates))
+        for column, values in dates.items():
+            df[column] = values
+        return df
+
+    def _errors(self, df: DataFrame, dates: dict) -> list:
+        """Missing required values and unparsable dates, `dates` are the parsed date columns of the text in `df`."""
+        errors = []
+        # Checking the parsed dates for NaT is cheaper than checking the text, the text is only looked at if there are.
+        for column in self.required:
+            missing = dates[column].isna() if column in dates else df[column].isna()
+            if column in dates and missing.any():
+                missing = df[column].isna()
+            errors += CSVSchema._invalid(df, column, missing, "missing")
+        for column, date_format in self.dates.items():
+            invalid = dates[column].isna()
+            if invalid.any():
+                invalid &= df[column].notna()
+            errors += CSVSchema._invalid(df, column, invalid, f"not dates in {date_format}")
+        return errors
+
+    def _raise_errors(self, path: str, name: str, error: Exception):
+        try:
+            df = pd.read_csv(path, dtype=str)
+        except ValueError:
+            raise ValueError(f"Invalid source {name} ({path}): {error}") from error
+        missing = [column for column in self.columns if column not in df.columns]
+        if missing:
+            raise ValueError(f"Invalid source {name} ({path}): missing columns {', '.join(missing)}") from error
+        errors = []
+        for column, dtype in self.columns.items():
+            if column in self.dates or dtype == 'str':
+                continue
+            numbers = pd.to_numeric(df[column], errors='coerce')
+            invalid = numbers.isna() & df[column].notna()
+            if np.dtype(dtype).kind in 'iu':
+                invalid |= numbers.isna() | (numbers % 1 != 0)
+            errors += CSVSchema._invalid(df, column, invalid, f"not {dtype}")
+        errors += self._errors(df, {
+            column: pd.to_datetime(df[column], format=date_format, errors='coerce')
+            for column, date_format in self.dates.items()
+        })
+        CSVSchema._raise(path, name, errors)
+
+    @staticmethod
+    def _raise(path: str, name: str, errors: list):
+        if errors:
+            raise ValueError(f"Invalid source {name} ({path}): " + "; ".join(errors))
+
+    @staticmethod
+    def _invalid(df: DataFrame, column: str, invalid, problem: str) -> list:
+        """Description of the invalid values of `column`, with their line numbers in the file (1 is the header)."""
+        if not invalid.any():
+            return []
+        rows = np.flatnonzero(invalid.to_numpy())
+        examples = ", ".join(
+            f"line {row + 2}: {df[column].iat[row]!r}" for row in rows[:MAX_REPORTED_VALUES]
+        )
+        more = f" and {len(rows) - MAX_REPORTED_VALUES} more" if len(rows) > MAX_REPORTED_VALUES else ""
+        return [f"{column} {problem} ({examples}{more})"]
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import requests
+
+from utilities.data.files import write_atomic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIRROR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'cache', 'sources')
+
+
+class CSVSource:
+    """
+    A CSV file served over HTTP and mirrored on the local disk.
+
+    Every fetch sends a conditional request (If-None-Match / If-Modified-Since) built from the mirror, so unchanged
+    files are not transferred again. When the network is down the mirror is used as is. Sources that are not http(s)
+    URLs are read straight from the local file system.
+    """
+
+    def __init__(self, url: str, mirror_dir: str = DEFAULT_MIRROR_DIR, timeout: float = 10, retries: int = 2,
+                 session: requests.Session = None):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.session = session if session is not None else requests.Session()
+        self.is_remote = url.startswith('http://') or url.startswith('https://')
+        if self.is_remote:
+            url_hash = hashlib.sha1(url.encode()).hexdigest()[:12]
+            self.path = os.path.join(mirror_dir, f"{url_hash}-{os.path.basename(url)}")
+        else:
+            self.path = url
+        self.meta_path = self.path + '.meta.json'
+        # Content digest of the file as of the last fetch, None before the first one.
+        self.digest = None
+        self._signature = None
+
+    def fetch(self) -> bool:
+        """Bring the local copy up to date and return whether its content changed since the last fetch."""
+        if self.is_remote:
+            digest = self._fetch_remote()
+        else:
+            digest = self._fetch_local()
+        changed = digest != self.digest
+        self.digest = digest
+        return changed
+
+    def modified(self) -> bool:
+        """
+        Cheap check whether the local file changed since the last fetch, by its size and mtime.
+
+        Remote sources always report False, they are only checked by fetching them.
+        """
+        if self.is_remote or self._signature is None:
+            return False
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) != self._signature
+
+    def close(self):
+        self.session.close()
+
+    def _fetch_remote(self) -> str:
+        meta = self._read_meta()
+        headers = {}
+        if meta is not None and os.path.exists(self.path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        else:
+            meta = None
+
+        try:
+            response = self._get(headers)
+            if response.status_code == 304 and meta is not None:
+                return meta['sha256']
+            response.raise_for_status()
+        except requests.RequestException:
+            if meta is None:
+                raise
+            logger.warning("Fetching %s failed, using the local mirror", self.url, exc_info=True)
+            return meta['sha256']
+
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_atomic(self.path, content)
+        write_atomic(self.meta_path, json.dumps({
+            'url': self.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': digest
+        }).encode())
+        return digest
+
+    def _get(self, headers: dict) -> requests.Response:
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+                # Retry server side errors as well, client errors will not go away by asking again.
+                if response.status_code < 500 or attempt == self.retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            time.sleep(0.5 * 2 ** attempt)
+
+    def _fetch_local(self) -> str:
+        stat = os.stat(self.path)
+        # Cheap change detection for local files, the content is only hashed when size or mtime moved.
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self.digest is not None and signature == self._signature:
+            return self.digest
+        self._signature = signature
+        with open(self.path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,9 @@
+import os
+
+
+def write_atomic(path: str, content: bytes):
+    """Write `content` to `path` through a temporary file, so readers see either the old or the new content."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
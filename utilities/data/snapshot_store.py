@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from utilities.data.files import write_atomic
+from utilities.data.utility_data import UtilityData, SNAPSHOT_FORMAT_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'cache', 'snapshots')
+
+
+class SnapshotStore:
+    """
+    Prepared utility data persisted on the local disk, keyed by the content digests of the sources it was prepared
+    from and the end of the next contract.
+
+    A process starting on unchanged sources loads the prepared frames instead of parsing and preparing the CSVs
+    again, and processes sharing the directory share the result. Every snapshot is a UtilityData.to_bytes file with a
+    meta JSON next to it. The preparation depends on the current date as well (contracts that ended), so the meta
+    records until when the snapshot is valid. The last `keep` snapshots are kept.
+
+    One of the processes sharing the directory leads: it fetches the sources and stores what it prepared, the others
+    load the `latest` snapshot. The leader holds a file lock in the directory, when it exits another process takes
+    over. Without fcntl (Windows) every process leads.
+    """
+
+    def __init__(self, directory: str = DEFAULT_SNAPSHOT_DIR, keep: int = 3):
+        self.directory = directory
+        self.keep = keep
+        self._lock_file = None
+        self._lock_pid = None
+
+    @staticmethod
+    def key(digests: dict, preparation_version: int, valid_until: pd.Timestamp = None) -> str:
+        """
+        Key of the snapshot prepared from sources with the given content digests, by source name, until
+        `valid_until`. The same sources prepared after it give different data under a different key.
+        """
+        digest = hashlib.sha256(f"{SNAPSHOT_FORMAT_VERSION}:{preparation_version}".encode())
+        for name in sorted(digests):
+            digest.update(f"\n{name}:{digests[name]}".encode())
+        digest.update(f"\nvalid_until:{valid_until.isoformat() if valid_until is not None else None}".encode())
+        return digest.hexdigest()[:32]
+
+    def load(self, key: str):
+        """Return the UtilityData stored under `key`, None if there is none or it is no longer valid."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        if meta.get('valid_until') is not None and pd.Timestamp.now() > pd.Timestamp(meta['valid_until']):
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                # Frames are decoded into memory of their own. Arrow may keep views of the mapping until its buffers
+                # are released, so the mapping is left to be unmapped with them instead of being closed here.
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            utility_data = UtilityData.from_bytes(data)
+        except (OSError, ValueError):
+            logger.warning("Loading the stored snapshot %s failed", key, exc_info=True)
+            return None
+        # A snapshot loaded again for sources that changed back is the latest one for the other processes.
+        try:
+            os.utime(self._meta_path(key))
+        except OSError:
+            pass
+        return utility_data
+
+    def latest(self):
+        """Key of the snapshot stored or loaded last, None if there is none."""
+        metas = self._metas()
+        if not metas:
+            return None
+        return os.path.basename(metas[0])[:-len('.meta.json')]
+
+    def lead(self) -> bool:
+        """Whether this process leads, taking the lead when no other process holds it."""
+        if fcntl is None:
+            return True
+        if self._lock_file is not None and self._lock_pid == os.getpid():
+            return True
+        # A lock file inherited from the parent process is not ours.
+        self._lock_file = None
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, 'refresh.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file, self._lock_pid = lock_file, os.getpid()
+        logger.info("Process %d leads the refreshes of %s", self._lock_pid, self.directory)
+        return True
+
+    def release(self):
+        """Give up the lead, e.g. before forking the processes that take it over."""
+        if self._lock_file is not None and self._lock_pid == os.getpid():
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+        self._lock_file = self._lock_pid = None
+
+    def save(self, key: str, utility_data: UtilityData, valid_until: pd.Timestamp = None):
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomic(self._path(key), utility_data.to_bytes())
+        # The meta is written last, a snapshot without one is never loaded.
+        write_atomic(self._meta_path(key), json.dumps({
+            'valid_until': valid_until.isoformat() if valid_until is not None else None
+        }).encode())
+        self._prune()
+
+    def _metas(self) -> list:
+        """Paths of the meta files, the most recently written or loaded first."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        metas = [os.path.join(self.directory, name) for name in names if name.endswith('.meta.json')]
+        metas.sort(key=SnapshotStore._mtime, reverse=True)
+        return metas
+
+    def _prune(self):
+        for meta_path in self._metas()[self.keep:]:
+            for path in [meta_path, meta_path[:-len('.meta.json')] + '.utds']:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.utds")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.meta.json")
+
+    def _read_meta(self, key: str):
+        try:
+            with open(self._meta_path(key)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        # Another process may prune the file meanwhile.
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
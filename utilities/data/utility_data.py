@@ -1,8 +1,37 @@
-from pandas import DataFrame, read_json
-import re
+import base64
+import json
+import struct
+
+import numpy as np
+
+from pandas import Categorical, CategoricalDtype, DataFrame, Index, to_datetime
+from pandas.api.types import is_categorical_dtype, is_datetime64_any_dtype, is_datetime64tz_dtype, pandas_dtype
+
+from utilities.data.utility_data_index import UtilityDataIndex
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+# Version of the snapshot layout written by UtilityData.to_bytes / to_json.
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_MAGIC = b'UTDS'
 
 
 class UtilityData:
+    # Frames that make up a snapshot, in the order they are serialized.
+    frames = [
+        'measurements_df',
+        'contracts_df',
+        'contract_anex_df',
+        'contract_payment_plan_df',
+        'contract_settlement_df',
+        'contract_bonus_df',
+        'measurement_rollups_df'
+    ]
+
     def __init__(
             self,
             measurements_df: DataFrame = None,
@@ -10,7 +39,8 @@ class UtilityData:
             contract_anex_df: DataFrame = None,
             contract_payment_plan_df: DataFrame = None,
             contract_settlement_df: DataFrame = None,
-            contract_bonus_df: DataFrame = None
+            contract_bonus_df: DataFrame = None,
+            measurement_rollups_df: DataFrame = None
     ):
         self.measurements_df = measurements_df
         self.contracts_df = contracts_df
@@ -18,52 +48,172 @@ class UtilityData:
         self.contract_payment_plan_df = contract_payment_plan_df
         self.contract_settlement_df = contract_settlement_df
         self.contract_bonus_df = contract_bonus_df
+        # Weekly, monthly and contract year sums and end of period aggregates of the daily series of every contract.
+        self.measurement_rollups_df = measurement_rollups_df
+        self._index = None
 
-    def refresh(self):
-        pass
+    @property
+    def index(self) -> UtilityDataIndex:
+        """Partitions of the frames for the graph callbacks, built on first use."""
+        if self._index is None:
+            self._index = UtilityDataIndex(self.measurements_df, self.contracts_df, self.contract_payment_plan_df,
+                                           self.measurement_rollups_df)
+        return self._index
 
-    def to_json(self, date_format="iso", orient="split"):
-        contracts = self.contracts_df.to_json(date_format=date_format, orient=orient)
-        contract_anex = self.contract_anex_df.to_json(date_format=date_format, orient=orient)
-        contract_payment_plan = self.contract_payment_plan_df.to_json(date_format=date_format, orient=orient)
-        contract_settlement = self.contract_settlement_df.to_json(date_format=date_format, orient=orient)
-        contract_bonus = self.contract_bonus_df.to_json(date_format=date_format, orient=orient)
-        measurements = self.measurements_df.to_json(date_format=date_format, orient=orient)
-        json_object = f"""
-                {{
-                    "measurements_df": {measurements},
-                    "contracts_df": {contracts},
-                    "contract_anex_df": {contract_anex},
-                    "contract_payment_plan_df": {contract_payment_plan},
-                    "contract_settlement_df": {contract_settlement},
-                    "contract_bonus_df": {contract_bonus}
-                }}
-            """
-        # simplify json by removing any empty lines and spaces.
-        json_object = re.sub(r"[\n\t\s]*", "", json_object)
-        return json_object
+    def refresh(self) -> bool:
+        pass
 
-    @staticmethod
-    def from_json(json_data, orient='split'):
-        json_data = json_data[19:-1]
-        measurements, json_data = json_data.split(",\"contracts_df\":")
-        contracts, json_data = json_data.split(",\"contract_anex_df\":")
-        contract_anex, json_data = json_data.split(",\"contract_payment_plan_df\":")
-        contract_payment_plan, json_data = json_data.split(",\"contract_settlement_df\":")
-        contract_settlement, contract_bonus = json_data.split(",\"contract_bonus_df\":")
-
-        measurements_df = read_json(measurements, orient=orient)
-        contracts_df = read_json(contracts, orient=orient)
-        contract_anex_df = read_json(contract_anex, orient=orient)
-        contract_payment_plan_df = read_json(contract_payment_plan, orient=orient)
-        contract_settlement_df = read_json(contract_settlement, orient=orient)
-        contract_bonus_df = read_json(contract_bonus, orient=orient)
+    def snapshot(self):
+        """Return a UtilityData sharing the current frames, unaffected by later refreshes of this object."""
         return UtilityData(
-            measurements_df,
-            contracts_df,
-            contract_anex_df,
-            contract_payment_plan_df,
-            contract_settlement_df,
-            contract_bonus_df
+            self.measurements_df,
+            self.contracts_df,
+            self.contract_anex_df,
+            self.contract_payment_plan_df,
+            self.contract_settlement_df,
+            self.contract_bonus_df,
+            self.measurement_rollups_df
         )
 
+    def memory_report(self, seen: set = None) -> dict:
+        """
+        Bytes held by every frame, object columns included. Frames in `seen` (by id) count as 0 bytes, the counted ones
+        are added to it.
+        """
+        seen = set() if seen is None else seen
+        report = {}
+        for name in UtilityData.frames:
+            df = getattr(self, name)
+            if df is None or id(df) in seen:
+                report[name] = 0
+                continue
+            seen.add(id(df))
+            report[name] = int(df.memory_usage(deep=True).sum())
+        return report
+
+    def memory_usage(self, seen: set = None) -> int:
+        """Bytes held by the frames, skipping frames in `seen` (by id) and adding the counted ones to it."""
+        return sum(self.memory_report(seen).values())
+
+    def to_bytes(self, encoding: str = None) -> bytes:
+        """
+        Serialize all frames into one binary snapshot.
+
+        Frames are stored as Arrow IPC streams when pyarrow is installed and as column wise JSON otherwise, both keep
+        dtypes, datetimes and the index intact. The layout is SNAPSHOT_MAGIC, the header length, a JSON header
+        with the format version, encoding and the byte range of every frame, followed by the frames.
+        """
+        if encoding is None:
+            encoding = 'arrow' if pyarrow is not None else 'json'
+        bodies = [UtilityData._encode_frame(getattr(self, name), encoding) for name in UtilityData.frames]
+        ranges = {}
+        offset = 0
+        for name, body in zip(UtilityData.frames, bodies):
+            ranges[name] = [offset, len(body)]
+            offset += len(body)
+        header = json.dumps({
+            'version': SNAPSHOT_FORMAT_VERSION,
+            'encoding': encoding,
+            'frames': ranges
+        }).encode()
+        return b''.join([SNAPSHOT_MAGIC, struct.pack('<I', len(header)), header] + bodies)
+
+    @staticmethod
+    def from_bytes(data: bytes):
+        if data[:4] != SNAPSHOT_MAGIC:
+            raise ValueError("Not a utility data snapshot")
+        header_length, = struct.unpack('<I', data[4:8])
+        header = json.loads(data[8:8 + header_length])
+        if header['version'] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported utility data snapshot version {header['version']}")
+        body = memoryview(data)[8 + header_length:]
+        frames = {
+            name: UtilityData._decode_frame(body[offset:offset + length], header['encoding'])
+            for name, (offset, length) in header['frames'].items()
+        }
+        return UtilityData(**frames)
+
+    def to_json(self) -> str:
+        """Serialize into a JSON string, e.g. for a dcc.Store. The binary snapshot is embedded base64 encoded."""
+        return json.dumps({
+            'version': SNAPSHOT_FORMAT_VERSION,
+            'snapshot': base64.b64encode(self.to_bytes()).decode('ascii')
+        })
+
+    @staticmethod
+    def from_json(json_data: str):
+        return UtilityData.from_bytes(base64.b64decode(json.loads(json_data)['snapshot']))
+
+    @staticmethod
+    def _encode_frame(df: DataFrame, encoding: str) -> bytes:
+        if df is None:
+            return b''
+        if encoding == 'arrow':
+            if pyarrow is None:
+                raise ValueError("Writing an arrow encoded utility data snapshot requires pyarrow")
+            table = pyarrow.Table.from_pandas(df)
+            sink = pyarrow.BufferOutputStream()
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+        if encoding == 'json':
+            # Column wise lists keep floats exact (repr) and decode without going through per row objects.
+            return json.dumps({
+                'dtypes': {str(column): UtilityData._json_dtype(dtype) for column, dtype in df.dtypes.items()},
+                'index': UtilityData._json_values(df.index),
+                'index_dtype': UtilityData._json_dtype(df.index.dtype),
+                'columns': {str(column): UtilityData._json_values(values) for column, values in df.items()}
+            }).encode()
+        raise ValueError(f"Unknown utility data snapshot encoding {encoding}")
+
+    @staticmethod
+    def _json_dtype(dtype):
+        """The dtype as its name, categoricals with their categories in order and whether they are ordered."""
+        if is_categorical_dtype(dtype):
+            return {
+                'categories': UtilityData._json_values(dtype.categories),
+                'categories_dtype': UtilityData._json_dtype(dtype.categories.dtype),
+                'ordered': bool(dtype.ordered)
+            }
+        return str(dtype)
+
+    @staticmethod
+    def _json_values(values) -> list:
+        if is_categorical_dtype(values.dtype):
+            # The codes, the categories are stored with the dtype.
+            return np.asarray(values.codes if hasattr(values, 'codes') else values.cat.codes).tolist()
+        if is_datetime64_any_dtype(values.dtype):
+            return values.to_numpy(dtype='datetime64[ns]').view('int64').tolist()
+        return values.to_numpy().tolist()
+
+    @staticmethod
+    def _restore_values(values: list, dtype):
+        if isinstance(dtype, dict):
+            categories = UtilityData._restore_values(dtype['categories'], dtype['categories_dtype'])
+            return Categorical.from_codes(values, dtype=CategoricalDtype(categories, dtype['ordered']))
+        dtype = pandas_dtype(dtype)
+        if is_datetime64_any_dtype(dtype):
+            timestamps = to_datetime(values, unit='ns', utc=is_datetime64tz_dtype(dtype))
+            return timestamps.tz_convert(dtype.tz) if is_datetime64tz_dtype(dtype) else timestamps
+        if isinstance(dtype, np.dtype):
+            return np.array(values, dtype=dtype)
+        return Index(values, dtype=object).astype(dtype)
+
+    @staticmethod
+    def _decode_frame(body: memoryview, encoding: str):
+        if len(body) == 0:
+            return None
+        if encoding == 'arrow':
+            if pyarrow is None:
+                raise ValueError("Reading an arrow encoded utility data snapshot requires pyarrow")
+            return pyarrow.ipc.open_stream(pyarrow.py_buffer(body)).read_pandas()
+        if encoding == 'json':
+            frame = json.loads(bytes(body))
+            return DataFrame(
+                {
+                    column: UtilityData._restore_values(values, frame['dtypes'][column])
+                    for column, values in frame['columns'].items()
+                },
+                index=UtilityData._restore_values(frame['index'], frame['index_dtype'])
+            )
+        raise ValueError(f"Unknown utility data snapshot encoding {encoding}")
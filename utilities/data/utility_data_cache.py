@@ -0,0 +1,17 @@
+from klupps_snapshot_registry import SnapshotCache
+from utilities.data.utility_data import UtilityData
+
+
+class UtilityDataCache(SnapshotCache):
+    """
+    Process wide cache of the prepared utility data.
+
+    The fetcher is a UtilityData that refreshes in place, every published version is an immutable UtilityData
+    snapshot of it.
+    """
+
+    def get(self) -> UtilityData:
+        return super().get()
+
+    def get_version(self, version: int) -> UtilityData:
+        return super().get_version(version)
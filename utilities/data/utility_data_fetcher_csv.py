@@ -1,11 +1,63 @@
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Series
 
+from klupps_metrics import default_metrics
 from utilities import UtilityData
+from utilities.data.csv_schema import CSVSchema
+from utilities.data.csv_source import CSVSource, DEFAULT_MIRROR_DIR
+from utilities.data.snapshot_store import SnapshotStore, DEFAULT_SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
 
 
 class UtilityDataFetcherCSV(UtilityData):
+    # Columns of every source the preparation uses, read with these dtypes and date formats, other columns are skipped.
+    # IDs are text, rows without them are invalid.
+    schemas = {
+        'measurements': CSVSchema(
+            {'date': 'datetime64[ns]', 'contract': 'str', 'aggregate_consumption': 'float64', 'measure_unit': 'str'},
+            dates={'date': '%Y-%m-%d'},
+            required=['date', 'contract', 'measure_unit']
+        ),
+        'contracts': CSVSchema(
+            {'ID': 'str', 'Type': 'str', 'Address': 'str', 'ContractName': 'str', 'ContractYear': 'int64',
+             'From': 'datetime64[ns]', 'To': 'datetime64[ns]'},
+            dates={'From': '%Y-%m-%d', 'To': '%Y-%m-%d'},
+            required=['ID', 'Type', 'Address', 'ContractName', 'From']
+        ),
+        'contract_anex': CSVSchema(
+            {'ContractID': 'str', 'AnexStart': 'datetime64[ns]', 'AnexEnd': 'datetime64[ns]',
+             'Price/Unit': 'float64', 'YearlyBasePrice': 'float64', 'VAT%': 'float64'},
+            dates={'AnexStart': '%Y-%m-%d', 'AnexEnd': '%Y-%m-%d'},
+            required=['ContractID']
+        ),
+        'contract_payment_plan': CSVSchema(
+            {'PaymentID': 'str', 'ContractID': 'str', 'PaymentDate': 'datetime64[ns]', 'PaymentAmount': 'float64'},
+            dates={'PaymentDate': '%Y-%m-%d'},
+            required=['ContractID', 'PaymentDate']
+        ),
+        'contract_settlement': CSVSchema(
+            {'ContractID': 'str', 'SettlementDate': 'datetime64[ns]', 'SettlementAmount': 'float64'},
+            dates={'SettlementDate': '%Y-%m-%d'},
+            required=['ContractID', 'SettlementDate']
+        ),
+        # Bonuses are not part of the prepared data yet.
+        'contract_bonus': CSVSchema(
+            {'ContractID': 'str'},
+            required=['ContractID']
+        )
+    }
+    # Part of the key of persisted snapshots, bump it when the preparation changes its result.
+    preparation_version = 5
+    # Periods the daily series are rolled up into: weeks starting on Monday, calendar months and whole contracts.
+    rollup_granularities = ['W', 'M', 'Y']
+
     def __init__(
             self,
             measurements_source='https://raw.githubusercontent.com/klupp/HomeExpenses/main/measurements.csv',
@@ -13,44 +65,515 @@ class UtilityDataFetcherCSV(UtilityData):
             contract_anex_source='https://raw.githubusercontent.com/klupp/HomeExpenses/main/contracts/contract_anex.csv',
             contract_payment_plan_source='https://raw.githubusercontent.com/klupp/HomeExpenses/main/contracts/contract_payment_plan.csv',
             contract_settlement_source='https://raw.githubusercontent.com/klupp/HomeExpenses/main/contracts/contract_settlement.csv',
-            contract_bonus_source='https://raw.githubusercontent.com/klupp/HomeExpenses/main/contracts/contract_bonus.csv'
-
+            contract_bonus_source='https://raw.githubusercontent.com/klupp/HomeExpenses/main/contracts/contract_bonus.csv',
+            mirror_dir=DEFAULT_MIRROR_DIR,
+            timeout=10,
+            retries=2,
+            incremental=False,
+            snapshot_dir=DEFAULT_SNAPSHOT_DIR
     ):
         super().__init__()
-        self.utilities_measurements_source = measurements_source
-        self.utilities_contracts_source = contracts_source
-        self.utilities_contract_anex_source = contract_anex_source
-        self.utilities_contract_payment_plan_source = contract_payment_plan_source
-        self.utilities_contract_settlement_source = contract_settlement_source
-        self.utilities_contract_bonus_source = contract_bonus_source
+        # Rebuild only the daily series of contracts whose inputs changed since the last refresh.
+        self.incremental = incremental
+        # Contract fingerprints, stacking year and daily series of the last incremental preparation.
+        self._daily_state = None
+        # Prepared snapshots persisted by source content, the first refresh loads one instead of preparing the data
+        # when the sources did not change. None disables persisting.
+        self.snapshot_store = SnapshotStore(snapshot_dir) if snapshot_dir is not None else None
+        self.utilities_measurements_source = CSVSource(measurements_source, mirror_dir, timeout, retries)
+        self.utilities_contracts_source = CSVSource(contracts_source, mirror_dir, timeout, retries)
+        self.utilities_contract_anex_source = CSVSource(contract_anex_source, mirror_dir, timeout, retries)
+        self.utilities_contract_payment_plan_source = CSVSource(contract_payment_plan_source, mirror_dir, timeout,
+                                                                retries)
+        self.utilities_contract_settlement_source = CSVSource(contract_settlement_source, mirror_dir, timeout,
+                                                              retries)
+        self.utilities_contract_bonus_source = CSVSource(contract_bonus_source, mirror_dir, timeout, retries)
+        # Last parsed frame of every source, reused while the source does not change.
+        self.source_frames = {}
+        # Whether every source changed, for sources fetched ahead of loading them in the same refresh.
+        self._fetched_changes = {}
+        # Seconds spent fetching and parsing every source, and in the preparation steps, during the last refresh.
+        self.source_timings = {}
+        # End of the next contract, the prepared data changes once it passes even if no source does.
+        self.valid_until = None
+        # Snapshot key of the current data, the same in every process serving it.
+        self.snapshot_key = None
         self.refresh()
 
-    def refresh(self):
-        self.contracts_df = pd.read_csv(self.utilities_contracts_source)
-        self.contracts_df['From'] = pd.to_datetime(self.contracts_df['From'])
-        self.contracts_df['To'] = pd.to_datetime(self.contracts_df['To'])
+    @property
+    def sources(self):
+        return {
+            'measurements': self.utilities_measurements_source,
+            'contracts': self.utilities_contracts_source,
+            'contract_anex': self.utilities_contract_anex_source,
+            'contract_payment_plan': self.utilities_contract_payment_plan_source,
+            'contract_settlement': self.utilities_contract_settlement_source,
+            'contract_bonus': self.utilities_contract_bonus_source
+        }
+
+    def sources_modified(self) -> bool:
+        """
+        Whether a local source file changed since the last refresh, without reading any of them. For processes not
+        leading the snapshot store, whether the leader stored newer data.
+        """
+        if self.snapshot_store is not None and not self.snapshot_store.lead():
+            return self.snapshot_store.latest() not in (None, self.snapshot_key)
+        return any(source.modified() for source in self.sources.values())
+
+    def refresh(self) -> bool:
+        self.source_timings = {}
+        # Processes sharing a snapshot store leave fetching and preparing to the one leading it and load what it
+        # stored. Without any data yet, e.g. before the leader stored some, they prepare it themselves once.
+        if self.snapshot_store is not None and not self.snapshot_store.lead():
+            if self._load_latest_snapshot():
+                return True
+            if self.measurements_df is not None:
+                return False
+        expired = self.valid_until is not None and pd.Timestamp.now() > self.valid_until
+        if expired:
+            logger.info("A contract ended on %s, preparing the utility data again", self.valid_until.date())
+        try:
+            if self.snapshot_store is not None and self._load_stored_snapshot(expired):
+                return True
+            # Sources are loaded concurrently and every preparation step starts as soon as its own inputs are loaded.
+            with ThreadPoolExecutor(max_workers=len(self.sources) + 2) as executor:
+                loads = {name: executor.submit(self._load_source, name) for name in self.sources}
+                payment_plan = executor.submit(
+                    self._prepare, 'prepare_payment_plan', self.contract_payment_plan_df, loads,
+                    ['contract_payment_plan', 'contract_settlement', 'contracts'],
+                    self._prepare_payment_plan
+                )
+                measurements = executor.submit(
+                    self._prepare, 'prepare_data', None if expired else self.measurements_df, loads,
+                    ['measurements', 'contracts', 'contract_anex'],
+                    self._prepare_measurements
+                )
+                changed = any(load.result()[0] for load in loads.values())
+                contract_payment_plan_df = payment_plan.result()
+                measurements_df = measurements.result()
+        except Exception:
+            # Parse everything again on the next refresh, even if the sources do not change in the meantime.
+            for source in self.sources.values():
+                source.digest = None
+            self._fetched_changes = {}
+            raise
+        finally:
+            logger.info("Utility data refresh timings: %s", "; ".join(
+                f"{name} " + ", ".join(f"{step} {seconds:.3f}s" for step, seconds in timings.items())
+                for name, timings in self.source_timings.items()
+            ))
+            for name, timings in self.source_timings.items():
+                for step, seconds in timings.items():
+                    default_metrics.observe('utility_refresh_stage_seconds', seconds, part=name, stage=step)
+
+        # Nothing was parsed or recomputed when none of the sources changed since the last refresh.
+        if not changed and not expired and self.measurements_df is not None:
+            return False
+
+        self.contracts_df = self.source_frames['contracts']
+        self.valid_until = UtilityDataFetcherCSV.next_contract_end(self.contracts_df)
+        self.contract_anex_df = self.source_frames['contract_anex']
+        self.contract_settlement_df = self.source_frames['contract_settlement']
+        self.contract_bonus_df = self.source_frames['contract_bonus']
+        self.contract_payment_plan_df = contract_payment_plan_df
+        if measurements_df is not self.measurements_df or self.measurement_rollups_df is None:
+            start = time.perf_counter()
+            self.measurement_rollups_df = UtilityDataFetcherCSV.rollup_measurements(measurements_df)
+            seconds = time.perf_counter() - start
+            self.source_timings['rollup_measurements'] = {'prepare': seconds}
+            default_metrics.observe('utility_refresh_stage_seconds', seconds, part='rollup_measurements',
+                                    stage='prepare')
+        self.measurements_df = measurements_df
+        self.snapshot_key = self._snapshot_key(self.valid_until)
+        if self.snapshot_store is not None:
+            self._store_snapshot()
+        return True
+
+    def _snapshot_key(self, valid_until) -> str:
+        digests = {name: source.digest for name, source in self.sources.items()}
+        return SnapshotStore.key(digests, UtilityDataFetcherCSV.preparation_version, valid_until)
+
+    def snapshot_version(self) -> int:
+        """
+        Version of the current data derived from the content of the sources and the end of the next contract, so
+        processes serving the same data agree on it. Kept below 2^53 to survive JSON in the browser.
+        """
+        return int(self.snapshot_key[:13], 16)
+
+    def close(self):
+        """Close the HTTP sessions of the sources and give up leading the snapshot store."""
+        for source in self.sources.values():
+            source.close()
+        if self.snapshot_store is not None:
+            self.snapshot_store.release()
+
+    def _load_stored_snapshot(self, expired=False) -> bool:
+        """
+        Fetch all sources and, when they changed or the current data `expired`, load the data prepared from their
+        current content from the snapshot store. Return whether there was one.
+
+        Processes sharing the store prepare every content once, e.g. the first worker to see a change, or a process
+        preparing the data before the workers start. The raw contract frames come with the snapshot, the other sources
+        are parsed again when a later refresh has to prepare them.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.sources)) as executor:
+            self._fetched_changes = dict(zip(self.sources, executor.map(self._fetch_source, self.sources)))
+        if self.measurements_df is not None and not expired and not any(self._fetched_changes.values()):
+            return False
+        start = time.perf_counter()
+        # The data prepared from the same sources changes once a contract ended, the key depends on the contracts.
+        # They are small, when there is no snapshot for them they are parsed again with the other sources.
+        contract_df = self.source_frames.get('contracts')
+        if contract_df is None or self._fetched_changes.get('contracts'):
+            contract_df = UtilityDataFetcherCSV.schemas['contracts'].read(self.sources['contracts'].path, 'contracts')
+        key = self._snapshot_key(UtilityDataFetcherCSV.next_contract_end(contract_df))
+        stored = self.snapshot_store.load(key)
+        if stored is None:
+            return False
+        for name, changed in self._fetched_changes.items():
+            if changed:
+                self.source_frames.pop(name, None)
+        self._fetched_changes = {}
+        self._use_stored_snapshot(key, stored, start)
+        return True
+
+    def _load_latest_snapshot(self) -> bool:
+        """Load the data the leading process stored last, return whether it is newer than the current data."""
+        key = self.snapshot_store.latest()
+        if key is None or key == self.snapshot_key:
+            return False
+        start = time.perf_counter()
+        stored = self.snapshot_store.load(key)
+        if stored is None:
+            return False
+        self._use_stored_snapshot(key, stored, start)
+        return True
+
+    def _use_stored_snapshot(self, key: str, stored: UtilityData, start: float):
+        for name in UtilityData.frames:
+            setattr(self, name, getattr(stored, name))
+        self.valid_until = UtilityDataFetcherCSV.next_contract_end(self.contracts_df)
+        self.snapshot_key = key
+        self.source_frames.update({
+            'contracts': stored.contracts_df,
+            'contract_anex': stored.contract_anex_df,
+            'contract_settlement': stored.contract_settlement_df,
+            'contract_bonus': stored.contract_bonus_df
+        })
+        self.source_timings['snapshot_store'] = {'load': time.perf_counter() - start}
+        logger.info("Loaded the prepared utility data from the snapshot store")
+
+    def _store_snapshot(self):
+        start = time.perf_counter()
+        try:
+            self.snapshot_store.save(self.snapshot_key, self.snapshot(), self.valid_until)
+        except OSError:
+            logger.warning("Persisting the prepared utility data failed", exc_info=True)
+            return
+        seconds = time.perf_counter() - start
+        self.source_timings['snapshot_store'] = {'save': seconds}
+        default_metrics.observe('utility_refresh_stage_seconds', seconds, part='snapshot_store', stage='save')
+
+    @staticmethod
+    def next_contract_end(contract_df: DataFrame):
+        """
+        End of the next contract to end, None if none is left. prepare_daily treats ended contracts differently, so
+        data prepared before it is valid until then.
+        """
+        ends = contract_df.loc[contract_df['To'] >= pd.Timestamp.now(), 'To']
+        return ends.min() if len(ends) else None
+
+    def _fetch_source(self, name):
+        start = time.perf_counter()
+        changed = self.sources[name].fetch()
+        self.source_timings[name] = {'fetch': time.perf_counter() - start}
+        return changed
+
+    def _load_source(self, name):
+        source = self.sources[name]
+        if name in self._fetched_changes:
+            changed = self._fetched_changes.pop(name)
+        else:
+            changed = self._fetch_source(name)
+        fetched = time.perf_counter()
+        timings = self.source_timings[name]
+        if changed or name not in self.source_frames:
+            self.source_frames[name] = UtilityDataFetcherCSV.schemas[name].read(source.path, name)
+            timings['parse'] = time.perf_counter() - fetched
+        return changed, self.source_frames[name]
+
+    def _prepare(self, step, previous, loads, inputs, prepare):
+        loaded = [loads[name].result() for name in inputs]
+        if previous is not None and not any(changed for changed, _ in loaded):
+            return previous
+        start = time.perf_counter()
+        result = prepare(*[df for _, df in loaded])
+        self.source_timings[step] = {'prepare': time.perf_counter() - start}
+        return result
+
+    def _prepare_measurements(self, measure_df: DataFrame, contract_df: DataFrame, contract_anex_df: DataFrame):
+        if self.incremental:
+            return self.prepare_data_incremental(measure_df, contract_df, contract_anex_df)
+        df = UtilityDataFetcherCSV.prepare_data(measure_df, contract_df, contract_anex_df)
+        return UtilityDataFetcherCSV.compact_measurements(UtilityDataFetcherCSV.sort_measurements(df))
+
+    @staticmethod
+    def _prepare_payment_plan(payment_plan_df: DataFrame, settlement_df: DataFrame, contract_df: DataFrame):
+        return UtilityDataFetcherCSV.compact_payment_plan(
+            UtilityDataFetcherCSV.prepare_payment_plan(payment_plan_df, settlement_df, contract_df))
+
+    @staticmethod
+    def sort_measurements(df: DataFrame):
+        return df.sort_values(by=['date', 'contract'], kind='mergesort', ignore_index=True)
 
-        self.contract_anex_df = pd.read_csv(self.utilities_contract_anex_source)
-        self.contract_anex_df['AnexStart'] = pd.to_datetime(self.contract_anex_df['AnexStart'])
-        self.contract_anex_df['AnexEnd'] = pd.to_datetime(self.contract_anex_df['AnexEnd'])
+    @staticmethod
+    def compact_measurements(df: DataFrame):
+        """
+        Store the prepared daily series in compact dtypes: the contract as a categorical and the daily consumption and
+        price as float32.
+
+        Daily values stay well below 10^4, where float32 is exact to a few 10^-4. The aggregates reach 10^5 and are
+        shown with two decimals, so they stay float64. The series is computed in float64 before, so compacting does
+        not accumulate rounding errors.
+        """
+        return df.astype({
+            'contract': 'category',
+            'consumption': 'float32',
+            'price': 'float32'
+        })
 
-        self.contract_settlement_df = pd.read_csv(self.utilities_contract_settlement_source)
-        self.contract_settlement_df['SettlementDate'] = pd.to_datetime(self.contract_settlement_df['SettlementDate'])
+    @staticmethod
+    def rollup_measurements(df: DataFrame):
+        """
+        Roll the prepared daily series up into weekly, monthly and contract year periods of every contract.
+
+        Every period has the sums of the daily consumption and price and the aggregates at its last day, dated on that
+        day. The periods are taken on the stacked dates the graph shows. The sums are taken in float64, the daily values
+        are float32. Expects `df` ordered by date, like sort_measurements.
+        """
+        values = df[['contract', 'date', 'consumption', 'price', 'aggregate_consumption', 'aggregate_price']] \
+            .astype({'consumption': 'float64', 'price': 'float64'})
+        days = values['date'].to_numpy(dtype='datetime64[D]')
+        periods = {
+            # 1970-01-01, day 0, was a Thursday.
+            'W': days - (days.astype('int64') + 3) % 7,
+            'M': days.astype('datetime64[M]'),
+            'Y': np.zeros(len(days), dtype='int8')
+        }
+        rollups = []
+        for granularity in UtilityDataFetcherCSV.rollup_granularities:
+            rollup = values.groupby([values['contract'], periods[granularity]], sort=True, observed=True).agg(
+                date=('date', 'last'),
+                consumption=('consumption', 'sum'),
+                price=('price', 'sum'),
+                aggregate_consumption=('aggregate_consumption', 'last'),
+                aggregate_price=('aggregate_price', 'last')
+            )
+            rollups.append(rollup.reset_index(level=0).reset_index(drop=True).assign(granularity=granularity))
+        df = pd.concat(rollups, ignore_index=True)
+        return df[['granularity', 'contract', 'date', 'consumption', 'aggregate_consumption', 'price',
+                   'aggregate_price']].astype({
+            'granularity': pd.CategoricalDtype(UtilityDataFetcherCSV.rollup_granularities),
+            'contract': 'category'
+        })
 
-        self.contract_bonus_df = pd.read_csv(self.utilities_contract_bonus_source)
-        self.contract_bonus_df['BonusDate'] = pd.to_datetime(self.contract_bonus_df['BonusDate'])
+    @staticmethod
+    def compact_payment_plan(df: DataFrame):
+        """Store the contract and the payment IDs of the prepared payment plan as categoricals."""
+        return df.astype({'ContractID': 'category', 'PaymentID': 'category'})
+
+    def prepare_data_incremental(self, measure_df: DataFrame, contract_df: DataFrame, contract_anex_df: DataFrame):
+        """
+        Same result as prepare_data, but only the daily series of contracts whose inputs changed are rebuilt.
+
+        A contract is the unit of recomputation: its series is zero based on its minimum and accumulated from its
+        start, so any changed reading, contract or anex row invalidates the whole contract (at most a year of daily
+        rows), and so does a change of the readings of its meter its edges are interpolated from, while every other
+        contract is taken from the previous result.
+        """
+        readings_df = UtilityDataFetcherCSV.prepare_readings(measure_df, contract_df)
+        fingerprints = UtilityDataFetcherCSV.contract_fingerprints(readings_df, contract_df, contract_anex_df)
+        edges = UtilityDataFetcherCSV.interpolation_edges(readings_df, contract_df)
+        edge_hashes = pd.util.hash_pandas_object(edges, index=True)
+        daily_fingerprints = {
+            contract: (fingerprints.get(contract), edge_hash) for contract, edge_hash in edge_hashes.items()
+        }
+
+        contract_years = contract_df.set_index('ID')['ContractYear']
+        df = None
+        if self._daily_state is not None:
+            previous_fingerprints, min_contract_year, previous_df = self._daily_state
+            dirty = {
+                contract for contract, fingerprint in daily_fingerprints.items()
+                if previous_fingerprints.get(contract) != fingerprint
+            }
+            kept = ~previous_df['contract'].isin(dirty) & previous_df['contract'].isin(daily_fingerprints)
+            df = previous_df[kept]
+            if dirty:
+                updated_df = UtilityDataFetcherCSV.prepare_daily(readings_df, contract_df, contract_anex_df,
+                                                                 contracts=dirty,
+                                                                 min_contract_year=min_contract_year)
+                df = pd.concat([df, updated_df], ignore_index=True)
+            # The contract every period is stacked onto changed, all dates move.
+            if contract_years[df['contract'].unique()].min() != min_contract_year:
+                df = None
+            logger.info("Incremental preparation rebuilt %d of %d contracts", len(dirty), len(daily_fingerprints))
+
+        if df is None:
+            df = UtilityDataFetcherCSV.prepare_daily(readings_df, contract_df, contract_anex_df)
+            min_contract_year = contract_years[df['contract'].unique()].min()
+
+        # Kept contracts are compact already, concatenating them with rebuilt ones widens the dtypes again.
+        df = UtilityDataFetcherCSV.compact_measurements(UtilityDataFetcherCSV.sort_measurements(df))
+        self._daily_state = (daily_fingerprints, min_contract_year, df)
+        return df
 
-        self.contract_payment_plan_df = pd.read_csv(self.utilities_contract_payment_plan_source)
-        self.contract_payment_plan_df['PaymentDate'] = pd.to_datetime(self.contract_payment_plan_df['PaymentDate'])
-        self.contract_payment_plan_df = UtilityDataFetcherCSV.prepare_payment_plan(self.contract_payment_plan_df,
-                                                                                   self.contract_settlement_df,
-                                                                                   self.contracts_df)
+    @staticmethod
+    def contract_fingerprints(readings_df: DataFrame, contract_df: DataFrame, contract_anex_df: DataFrame):
+        """Digest of the readings, contract and anex rows the daily series of every contract is built from."""
+        contracts = contract_df.assign(
+            Old=contract_df['To'] < pd.Timestamp.now(),
+            NameYear=contract_df['ContractName'].map(contract_df.groupby('ContractName')['ContractYear'].min())
+        )
+        digests = {}
+        for name, df, key in [('contract', contracts, 'ID'), ('readings', readings_df, 'contract'),
+                              ('anex', contract_anex_df, 'ContractID')]:
+            row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            for contract, positions in df.groupby(key, sort=False).indices.items():
+                digest = digests.setdefault(contract, hashlib.sha1())
+                digest.update(name.encode())
+                digest.update(row_hashes[positions].tobytes())
+        return {contract: digest.hexdigest() for contract, digest in digests.items()}
 
-        measurements_df = pd.read_csv(self.utilities_measurements_source)
-        measurements_df['date'] = pd.to_datetime(measurements_df['date'])
-        measurements_df = UtilityDataFetcherCSV.prepare_data(measurements_df, self.contracts_df, self.contract_anex_df)
-        measurements_df.sort_values(by='date', inplace=True)
-        self.measurements_df = measurements_df
+    @staticmethod
+    def interpolation_edges(readings_df: DataFrame, contract_df: DataFrame) -> DataFrame:
+        """
+        Days and readings every daily series is interpolated within, indexed by the contract ID.
+
+        Every contract with readings gets a series from the day of its first to the day of its last reading, widened
+        to its From and To once it ended (start, end). The days before its first and after its last reading are
+        interpolated from the closest readings of the same meter (Type and Address) outside them (left and right date
+        and consumption), NaT and NaN where the meter has none. Readings are averaged per day, per contract for its own
+        readings and per meter for the edges.
+        """
+        old_contract_df = contract_df[contract_df['To'] < pd.Timestamp.now()]
+        reading_days = readings_df['date'].to_numpy(dtype='datetime64[D]').astype('int64')
+        days = np.concatenate([
+            reading_days,
+            old_contract_df['From'].to_numpy(dtype='datetime64[D]').astype('int64'),
+            old_contract_df['To'].to_numpy(dtype='datetime64[D]').astype('int64')
+        ])
+        # Contracts as their position in ID order.
+        codes, contracts = pd.factorize(np.concatenate([
+            readings_df['contract'].to_numpy(), old_contract_df['ID'].to_numpy(), old_contract_df['ID'].to_numpy()
+        ]), sort=True)
+        bounds = Series(days).groupby(codes).agg(['min', 'max'])
+        reading_codes = codes[:len(readings_df)]
+        valid = readings_df['aggregate_consumption'].notna().to_numpy()
+        own_days = Series(reading_days[valid]).groupby(reading_codes[valid]).agg(['min', 'max']) \
+            .reindex(bounds.index)
+        first = own_days['min'].fillna(bounds['min']).to_numpy(dtype='int64')
+        last = own_days['max'].fillna(bounds['max']).to_numpy(dtype='int64')
+
+        # The readings of every meter per day on one sorted axis, one meter after the other, so the closest readings
+        # of all contracts are searched at once.
+        meters = (contract_df['Type'] + " - " + contract_df['Address']).set_axis(contract_df['ID'])
+        contract_meters, _ = pd.factorize(meters.reindex(contracts).to_numpy(), sort=True)
+        base = days.min(initial=0)
+        stride = days.max(initial=0) - base + 1
+        meter_readings = Series(readings_df['aggregate_consumption'].to_numpy()[valid]).groupby(
+            contract_meters[reading_codes[valid]] * stride + (reading_days[valid] - base)).mean()
+        keys = meter_readings.index.to_numpy(dtype='int64')
+        left = np.searchsorted(keys, contract_meters * stride + (first - base), side='left') - 1
+        right = np.searchsorted(keys, contract_meters * stride + (last - base), side='right')
+        # A reading of no meter at the end, the positions before the first and after the last reading point to it.
+        meter_codes = np.append(keys // stride, -1)
+        meter_days = np.append(keys % stride + base, 0).astype('datetime64[D]')
+        values = np.append(meter_readings.to_numpy(), np.nan)
+        has_left = (contract_meters >= 0) & (meter_codes[left] == contract_meters)
+        has_right = (contract_meters >= 0) & (meter_codes[right] == contract_meters)
+        return DataFrame({
+            'start': bounds['min'].to_numpy().astype('datetime64[D]').astype('datetime64[ns]'),
+            'end': bounds['max'].to_numpy().astype('datetime64[D]').astype('datetime64[ns]'),
+            'left_date': np.where(has_left, meter_days[left], np.datetime64('NaT')).astype('datetime64[ns]'),
+            'left_consumption': np.where(has_left, values[left], np.nan),
+            'right_date': np.where(has_right, meter_days[right], np.datetime64('NaT')).astype('datetime64[ns]'),
+            'right_consumption': np.where(has_right, values[right], np.nan)
+        }, index=pd.Index(contracts, name='contract'))
+
+    @staticmethod
+    def interpolate_daily(readings_df: DataFrame, contract_df: DataFrame, contracts=None) -> DataFrame:
+        """
+        Daily aggregate consumption of every contract, from the start to the end of its interpolation_edges.
+
+        Days between the readings of a contract are linearly interpolated, the days before its first and after its last
+        reading towards the closest readings of its meter outside them, and held at the first or last reading of the
+        meter beyond those. Contracts without any reading of their meter are NaN.
+
+        All contracts are interpolated in a single np.interp: every contract gets its own range on one axis, starting
+        and ending with a point held at its value on its first and last day, so no contract reaches into the readings
+        of the next. Rows are ordered by contract ID and date. `contracts` limits the rows to the given contract IDs.
+        """
+        edges = UtilityDataFetcherCSV.interpolation_edges(readings_df, contract_df)
+        if contracts is not None:
+            edges = edges[edges.index.isin(contracts)]
+        starts = edges['start'].to_numpy(dtype='datetime64[D]').astype('int64')
+        ends = edges['end'].to_numpy(dtype='datetime64[D]').astype('int64')
+        has_left = edges['left_date'].notna().to_numpy()
+        has_right = edges['right_date'].notna().to_numpy()
+        left_days = edges['left_date'].to_numpy(dtype='datetime64[D]').astype('int64')[has_left]
+        right_days = edges['right_date'].to_numpy(dtype='datetime64[D]').astype('int64')[has_right]
+        reading_contracts = edges.index.get_indexer(readings_df['contract'].to_numpy())
+        valid = readings_df['aggregate_consumption'].notna().to_numpy() & (reading_contracts >= 0)
+        reading_days = readings_df['date'].to_numpy(dtype='datetime64[D]').astype('int64')[valid]
+        base = min(starts.min(initial=0), left_days.min(initial=0), reading_days.min(initial=0))
+        stride = max(ends.max(initial=0), right_days.max(initial=0), reading_days.max(initial=0)) - base + 1
+
+        # Points of every contract on the shared axis: the edge readings of its meter and its own readings.
+        positions = np.arange(len(edges))
+        own_readings = Series(readings_df['aggregate_consumption'].to_numpy()[valid]).groupby(
+            reading_contracts[valid] * stride + (reading_days - base)).mean()
+        x = np.concatenate([
+            positions[has_left] * stride + (left_days - base),
+            own_readings.index.to_numpy(dtype='int64'),
+            positions[has_right] * stride + (right_days - base)
+        ])
+        fp = np.concatenate([
+            edges['left_consumption'].to_numpy()[has_left],
+            own_readings.to_numpy(),
+            edges['right_consumption'].to_numpy()[has_right]
+        ])
+        order = np.argsort(x, kind='stable')
+        x, fp = x[order], fp[order]
+
+        # Hold the first and last point of every contract until its first and last day.
+        with_points = np.zeros(len(edges), dtype=bool)
+        with_points[x // stride] = True
+        held = positions[with_points]
+        first_points = np.searchsorted(x, held * stride, side='left')
+        last_points = np.searchsorted(x, (held + 1) * stride, side='left') - 1
+        x = np.concatenate([np.minimum(held * stride + (starts[with_points] - base), x[first_points]), x,
+                            np.maximum(held * stride + (ends[with_points] - base), x[last_points])])
+        fp = np.concatenate([fp[first_points], fp, fp[last_points]])
+        order = np.argsort(x, kind='stable')
+        x, fp = x[order], fp[order]
+        # np.interp needs increasing points, a held point on the day of a reading is dropped.
+        unique = np.ones(len(x), dtype=bool)
+        unique[:-1] = x[1:] != x[:-1]
+        x, fp = x[unique], fp[unique]
+
+        # One row per day of every contract.
+        lengths = ends - starts + 1
+        day_contracts = np.repeat(positions, lengths)
+        days = np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        consumption = np.interp(day_contracts * stride + (days - base), x, fp) if len(x) else \
+            np.full(len(days), np.nan)
+        consumption[~with_points[day_contracts]] = np.nan
+        return DataFrame({
+            'contract': edges.index.to_numpy()[day_contracts],
+            'date': days.astype('datetime64[D]').astype('datetime64[ns]'),
+            'aggregate_consumption': consumption
+        })
 
     @staticmethod
     def prepare_payment_plan(payment_plan_df: DataFrame, settlement_df: DataFrame, contract_df: DataFrame):
@@ -74,26 +597,108 @@ class UtilityDataFetcherCSV(UtilityData):
         df.sort_values(by='PaymentDate', inplace=True, ignore_index=True)
 
         # Calculate aggregate price
-        df['AggregatePaymentAmount'] = 0
-        for contract in df["ContractID"].unique():
-            df.loc[df['ContractID'] == contract, 'AggregatePaymentAmount'] = \
-                df[df['ContractID'] == contract]['PaymentAmount'].cumsum()
+        df['AggregatePaymentAmount'] = df.groupby('ContractID', sort=False)['PaymentAmount'] \
+            .transform(UtilityDataFetcherCSV._cumsum)
 
         # Stack contract periods over each other
-        min_contract_year = df['PaymentDate'].dt.year.min()
-        for contract_name in df['ContractID'].unique():
-            year = df[df['ContractID'] == contract_name]['PaymentDate'].dt.year.min()
-            df.loc[df['ContractID'] == contract_name, 'PaymentDate'] -= pd.offsets.DateOffset(
-                years=(year - min_contract_year))
+        payment_year = df['PaymentDate'].dt.year
+        contract_year = payment_year.groupby(df['ContractID'], sort=False).transform('min')
+        df['PaymentDate'] = UtilityDataFetcherCSV.subtract_years(df['PaymentDate'], contract_year - payment_year.min())
         return df
 
+    @staticmethod
+    def _cumsum(values: Series) -> Series:
+        # GroupBy.cumsum uses compensated summation, a plain cumsum per group keeps the aggregates bit identical to
+        # summing every contract on its own.
+        return values.cumsum()
+
+    @staticmethod
+    def subtract_years(dates: Series, years: Series) -> Series:
+        """
+        Vectorized `dates - DateOffset(years=years)` with a different number of years for every row.
+
+        Like DateOffset, a day that does not exist in the target month (29th of February) becomes its last day.
+        """
+        values = dates.to_numpy(dtype='datetime64[ns]')
+        days = values.astype('datetime64[D]')
+        months = values.astype('datetime64[M]')
+        target_months = months - (years.to_numpy(dtype='int64') * 12).astype('timedelta64[M]')
+        month_lengths = (target_months + 1).astype('datetime64[D]') - target_months.astype('datetime64[D]')
+        day_of_month = np.minimum(days - months.astype('datetime64[D]'), month_lengths - 1)
+        shifted = target_months.astype('datetime64[D]') + day_of_month + (values - days)
+        return Series(shifted.astype('datetime64[ns]'), index=dates.index, name=dates.name)
+
+    @staticmethod
+    def interval_join(df: DataFrame, on: str, date: str, intervals_df: DataFrame, interval_on: str, start: str,
+                      end: str) -> DataFrame:
+        """
+        Join every row of `df` with the rows of `intervals_df` of the same key whose [start, end] contains the row's
+        date.
+
+        Same rows in the same order as merging on the key (sort=False) and keeping the rows with start <= date <= end,
+        but the merge is never built: the rows of every key are sorted by date once and the bounds of its intervals
+        are looked up with searchsorted, so time and memory grow with the rows and the result instead of rows x
+        intervals per key. A row within several intervals is repeated for every one of them. The columns of both
+        frames must be distinct.
+        """
+        dates = df[date].to_numpy()
+        starts = intervals_df[start].to_numpy()
+        ends = intervals_df[end].to_numpy()
+        row_groups = df.groupby(on, sort=False).indices
+        row_parts = []
+        interval_parts = []
+        for key, intervals in intervals_df.groupby(interval_on, sort=False).indices.items():
+            rows = row_groups.get(key)
+            if rows is None:
+                continue
+            # Intervals with a missing bound contain no date.
+            intervals = intervals[~(np.isnat(starts[intervals]) | np.isnat(ends[intervals]))]
+            rows = rows[np.argsort(dates[rows], kind='mergesort')]
+            first = np.searchsorted(dates[rows], starts[intervals], side='left')
+            counts = np.maximum(np.searchsorted(dates[rows], ends[intervals], side='right') - first, 0)
+            # Positions first, first + 1, ... first + count - 1 of every interval, in one pass.
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            row_parts.append(rows[np.repeat(first, counts) + offsets])
+            interval_parts.append(np.repeat(intervals, counts))
+        row_positions = np.concatenate(row_parts) if row_parts else np.array([], dtype=np.intp)
+        interval_positions = np.concatenate(interval_parts) if interval_parts else np.array([], dtype=np.intp)
+
+        # The merge groups the rows per key, keys in order of their first row, and repeats every row for its matches.
+        group_first_rows = np.array([rows[0] for rows in row_groups.values()], dtype=np.intp)
+        first_rows = group_first_rows[pd.Index(list(row_groups)).get_indexer(df[on].to_numpy()[row_positions])]
+        order = np.lexsort((interval_positions, row_positions, first_rows))
+        return pd.concat([
+            df.take(row_positions[order]).reset_index(drop=True),
+            intervals_df.take(interval_positions[order]).reset_index(drop=True)
+        ], axis=1)
+
+    @staticmethod
+    def continue_restarted_meters(df: DataFrame):
+        """
+        Make the readings of every meter (TypeAddress) continuous over counter restarts.
+
+        A reading of 0 after the first reading of a meter is a restart, from there on all readings of that meter are
+        offset by the reading just before it. The offsets of consecutive restarts add up, so they are computed in one
+        pass as a cumulative sum per meter. Expects `df` ordered by date.
+        """
+        meter_consumption = df.groupby('TypeAddress', sort=False)['aggregate_consumption']
+        restarts = (df['aggregate_consumption'] == 0) & (meter_consumption.cumcount() > 0)
+        restart_offsets = meter_consumption.shift(1).where(restarts, 0)
+        return df['aggregate_consumption'] + restart_offsets.groupby(df['TypeAddress'], sort=False).cumsum()
+
     @staticmethod
     def prepare_data(measure_df: DataFrame, contract_df: DataFrame, contract_anex_df: DataFrame):
-        measure_df_columns = measure_df.columns
+        readings_df = UtilityDataFetcherCSV.prepare_readings(measure_df, contract_df)
+        return UtilityDataFetcherCSV.prepare_daily(readings_df, contract_df, contract_anex_df)
+
+    @staticmethod
+    def prepare_readings(measure_df: DataFrame, contract_df: DataFrame):
+        """Convert the raw readings to kWh and make them continuous over meter restarts."""
         df = measure_df.copy()
 
-        # Join with contracts to expand information for each measurement.
-        df = df.merge(contract_df, left_on='contract', right_on='ID', sort=False)
+        # Join with contracts to expand information for each measurement, only the meter (type and address) is needed.
+        meters = contract_df[['ID']].assign(TypeAddress=contract_df['Type'] + " - " + contract_df['Address'])
+        df = df.merge(meters, left_on='contract', right_on='ID', sort=False)
 
         # Order by date. IMPORTANT!!!
         df.sort_values(by='date', inplace=True, ignore_index=True)
@@ -106,70 +711,46 @@ class UtilityDataFetcherCSV(UtilityData):
         df.loc[df['measure_unit'] == 'm3', 'measure_unit'] = 'kWh'
 
         # Handle meter changes (restart of the counter). For each address and type of meters.
-        df["TypeAddress"] = df['Type'] + " - " + df['Address']
-
-        for meter in df["TypeAddress"].unique():
-            at_df = df[df['TypeAddress'] == meter]
-            at_df_index = np.array(at_df.index)
-            zeros = at_df.index[at_df['aggregate_consumption'] == 0]
-            for zero in np.flip(zeros):
-                zero_loc = np.where(at_df_index == zero)[0][0]
-                if zero_loc == 0:
-                    continue
-                for_update_mask = np.zeros(df.shape[0])
-                for_update_mask[zero:] = 1
-                df.loc[(df['TypeAddress'] == meter) & for_update_mask, 'aggregate_consumption'] += \
-                    df.at[at_df_index[zero_loc - 1], 'aggregate_consumption']
+        df['aggregate_consumption'] = UtilityDataFetcherCSV.continue_restarted_meters(df)
+        return df[['date', 'contract', 'aggregate_consumption']].copy()
 
-        old_contract_df = contract_df[contract_df['To'] < pd.Timestamp.now()]
-        df_interpol = df[['date', 'contract', 'aggregate_consumption']].copy()
-        df_start_contracts = old_contract_df[['From', "ID"]]
-        df_start_contracts['aggregate_consumption'] = np.NAN
-        df_start_contracts.columns = ['date', 'contract', 'aggregate_consumption']
-
-        df_end_contracts = old_contract_df[['To', "ID"]]
-        df_end_contracts['aggregate_consumption'] = np.NAN
-        df_end_contracts.columns = ['date', 'contract', 'aggregate_consumption']
-
-        df_interpol = pd.concat([df_interpol, df_start_contracts, df_end_contracts], ignore_index=True)
-        df_interpol.sort_values(by='date', inplace=True, ignore_index=True)
-        df_interpol.index = df_interpol['date']
-        del df_interpol['date']
-        df_interpol = df_interpol.groupby('contract') \
-            .resample('D') \
-            .mean()
-        df_interpol['aggregate_consumption'] = df_interpol['aggregate_consumption'].interpolate(limit_direction='both')
-        df_interpol = df_interpol.reset_index()
-
-        df = df_interpol
-
-        # Join with contracts to expand information for each measurement.
-        df = df.merge(contract_df, left_on='contract', right_on='ID', sort=False)
+    @staticmethod
+    def prepare_daily(readings_df: DataFrame, contract_df: DataFrame, contract_anex_df: DataFrame, contracts=None,
+                      min_contract_year=None):
+        """
+        Build the daily consumption and price series of every contract from the prepared readings.
+
+        `contracts` limits the series built to the given contract IDs. `min_contract_year` is the year all contract
+        periods are stacked onto, by default the first year of the built contracts.
+        """
+        df = UtilityDataFetcherCSV.interpolate_daily(readings_df, contract_df, contracts)
+
+        # Join every day with its contract, only the columns used below, and keep the days within the contract period.
+        df = UtilityDataFetcherCSV.interval_join(df, 'contract', 'date',
+                                                 contract_df[['ID', 'ContractName', 'ContractYear', 'From', 'To']],
+                                                 'ID', 'From', 'To')
 
         # Order by date. IMPORTANT!!!
         df.sort_values(by='date', inplace=True, ignore_index=True)
 
-        df = df[(df['date'] >= df['From']) & (df['date'] <= df['To'])]
-
         # Start every contract from 0 kWh
-        for contract_name in df['contract'].unique():
-            contract_mask = df['contract'] == contract_name
-            df.loc[contract_mask, 'aggregate_consumption'] -= \
-                df[contract_mask]['aggregate_consumption'].min()
+        contract_consumption = df.groupby('contract', sort=False)['aggregate_consumption']
+        df['aggregate_consumption'] -= contract_consumption.transform('min')
 
         # Calculate consumption
-        df['consumption'] = 0
-        for contract in df["contract"].unique():
-            meter_df = df[df['contract'] == contract].copy()
-            aggregate_consumption = meter_df.aggregate_consumption.to_numpy()
-            aggregate_consumption_shifted = np.concatenate(([aggregate_consumption[0]], aggregate_consumption))[0:-1]
-            df.loc[df['contract'] == contract, 'consumption'] = (
-                    aggregate_consumption - aggregate_consumption_shifted).clip(min=0)
+        contract_consumption = df.groupby('contract', sort=False)['aggregate_consumption']
+        first_of_contract = contract_consumption.cumcount() == 0
+        df['consumption'] = contract_consumption.diff() \
+            .mask(first_of_contract, df['aggregate_consumption'] - df['aggregate_consumption']) \
+            .clip(lower=0)
 
         # Calculate price
-        # to calculate the price first we have to join with the contract anexes
-        df = df.merge(contract_anex_df, left_on='contract', right_on='ContractID', sort=False)
-        df = df[(df['date'] >= df['AnexStart']) & (df['date'] <= df['AnexEnd'])]
+        # to calculate the price first we have to join every day with the contract anex in force on it
+        df = UtilityDataFetcherCSV.interval_join(
+            df, 'contract', 'date',
+            contract_anex_df[['ContractID', 'AnexStart', 'AnexEnd', 'Price/Unit', 'YearlyBasePrice', 'VAT%']],
+            'ContractID', 'AnexStart', 'AnexEnd'
+        )
 
         df['price'] = (df['consumption'] * df['Price/Unit'] + df['YearlyBasePrice'] / 365) * (
                     1 + df['VAT%'] * 1.0 / 100)
@@ -178,16 +759,14 @@ class UtilityDataFetcherCSV(UtilityData):
         df.sort_values(by='date', inplace=True, ignore_index=True)
 
         # Calculate aggregate price
-        df['aggregate_price'] = 0
-        for contract in df["contract"].unique():
-            df.loc[df['contract'] == contract, 'aggregate_price'] = df[df['contract'] == contract]['price'].cumsum()
+        df['aggregate_price'] = df.groupby('contract', sort=False)['price'].transform(UtilityDataFetcherCSV._cumsum)
 
         # Stack contract periods over each other
-        min_contract_year = df['ContractYear'].min()
-        for contract_name in df['ContractName'].unique():
-            year = contract_df[contract_df['ContractName'] == contract_name]['ContractYear'].min()
-            df.loc[df['ContractName'] == contract_name, 'date'] -= pd.offsets.DateOffset(
-                years=(year - min_contract_year))
+        if min_contract_year is None:
+            min_contract_year = df['ContractYear'].min()
+        contract_name_year = contract_df.groupby('ContractName')['ContractYear'].min()
+        df['date'] = UtilityDataFetcherCSV.subtract_years(
+            df['date'], df['ContractName'].map(contract_name_year) - min_contract_year)
 
         # Continuous consumption
         # for consumption_type in contract_df["Type"].unique():
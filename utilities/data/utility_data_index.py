@@ -0,0 +1,67 @@
+import numpy as np
+from pandas import DataFrame
+
+
+class UtilityDataIndex:
+    """
+    Partitions of a UtilityData snapshot for the graph callbacks.
+
+    The contracts are split per Type and the rows of the measurements and the payment plan are grouped per contract
+    ID, so selecting the data of a few contracts takes their row positions instead of filtering and merging the
+    whole tables. The rollups of the measurements are grouped per granularity and contract ID the same way. Selections
+    return the rows in the order an inner merge with the contracts does: grouped per contract, contracts in order of
+    their first row.
+    """
+
+    def __init__(self, measurements_df: DataFrame, contracts_df: DataFrame, contract_payment_plan_df: DataFrame,
+                 measurement_rollups_df: DataFrame = None):
+        self.measurements_df = measurements_df
+        self.contracts_df = contracts_df
+        self.contract_payment_plan_df = contract_payment_plan_df
+        self.measurement_rollups_df = measurement_rollups_df
+        # Type -> contracts of the type, in order of first appearance like contracts_df.Type.unique().
+        self.contracts_by_type = {
+            contract_type: contracts for contract_type, contracts in contracts_df.groupby('Type', sort=False)
+        }
+        # Contract ID -> row positions.
+        self.measurement_rows = measurements_df.groupby('contract', sort=False, observed=True).indices
+        self.payment_plan_rows = contract_payment_plan_df.groupby('ContractID', sort=False, observed=True).indices
+        # Granularity -> contract ID -> row positions.
+        self.rollup_rows = {}
+        if measurement_rollups_df is not None:
+            for (granularity, contract), rows in measurement_rollups_df.groupby(
+                    ['granularity', 'contract'], sort=False, observed=True).indices.items():
+                self.rollup_rows.setdefault(granularity, {})[contract] = rows
+
+    @property
+    def types(self) -> list:
+        return list(self.contracts_by_type)
+
+    def contracts(self, contract_type, contract_period=None) -> DataFrame:
+        """Contracts of `contract_type`, with `contract_period` only those of ContractYear within [first, last]."""
+        contracts = self.contracts_by_type.get(contract_type, self.contracts_df.iloc[:0])
+        if contract_period is not None:
+            contracts = contracts[
+                (contracts.ContractYear >= contract_period[0]) &
+                (contracts.ContractYear <= contract_period[1])
+            ]
+        return contracts
+
+    def measurements(self, contract_ids) -> DataFrame:
+        return UtilityDataIndex._take(self.measurements_df, self.measurement_rows, contract_ids)
+
+    def rollups(self, granularity, contract_ids) -> DataFrame:
+        if self.measurement_rollups_df is None:
+            raise ValueError("The utility data has no rollups of the measurements")
+        return UtilityDataIndex._take(self.measurement_rollups_df, self.rollup_rows.get(granularity, {}), contract_ids)
+
+    def payment_plan(self, contract_ids) -> DataFrame:
+        return UtilityDataIndex._take(self.contract_payment_plan_df, self.payment_plan_rows, contract_ids)
+
+    @staticmethod
+    def _take(df: DataFrame, rows: dict, contract_ids) -> DataFrame:
+        positions = [rows[contract_id] for contract_id in contract_ids if contract_id in rows]
+        if not positions:
+            return df.iloc[:0]
+        positions.sort(key=lambda contract_rows: contract_rows[0])
+        return df.take(np.concatenate(positions))
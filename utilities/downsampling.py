@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling, returns the indices of the `n_out` points to keep.
+
+    The first and last points are always kept. Every bucket in between keeps the point forming the largest triangle
+    with the point kept from the previous bucket and the average of the next bucket, which preserves the shape and the
+    extremes of the series.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous]) -
+            (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def min_max_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Keep the minimum and the maximum of `(n_out - 2) / 2` equal buckets, plus the first and last points."""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    edges = np.linspace(0, n, (n_out - 2) // 2 + 1).astype(int)[:-1]
+    positions = np.arange(n)
+    minimums = np.minimum.reduceat(y, edges)
+    maximums = np.maximum.reduceat(y, edges)
+    buckets = np.searchsorted(edges, positions, side='right') - 1
+    is_minimum = y == minimums[buckets]
+    is_maximum = y == maximums[buckets]
+    # First position of the minimum and maximum of every bucket.
+    first_minimum = np.minimum.reduceat(np.where(is_minimum, positions, n), edges)
+    first_maximum = np.minimum.reduceat(np.where(is_maximum, positions, n), edges)
+    return np.unique(np.concatenate([[0, n - 1], first_minimum, first_maximum]))
+
+
+def downsample(df: DataFrame, x: str, y: str, by: list, max_points: int, method: str = 'lttb') -> DataFrame:
+    """Reduce every trace (group of `by`) of `df`, ordered by `x`, to at most `max_points` points."""
+    kept = []
+    for _, positions in df.groupby(by, sort=False).indices.items():
+        if len(positions) <= max_points:
+            kept.append(positions)
+            continue
+        values = df[y].to_numpy(dtype=float)[positions]
+        if method == 'lttb':
+            x_values = pd.to_numeric(df[x].iloc[positions]).to_numpy(dtype=float)
+            kept.append(positions[lttb_indices(x_values, values, max_points)])
+        elif method == 'minmax':
+            kept.append(positions[min_max_indices(values, max_points)])
+        else:
+            raise ValueError(f"Unknown downsampling method {method}")
+    if not kept:
+        return df.iloc[:0]
+    return df.iloc[np.sort(np.concatenate(kept))]
+
+
+def clip_to_range(df: DataFrame, x: str, by: list, start, end) -> DataFrame:
+    """Keep the rows of every trace within [start, end] and the closest row on either side, so lines reach the edges."""
+    inside = (df[x] >= start) & (df[x] <= end)
+    group = df.groupby(by, sort=False)
+    before_next = group[x].shift(-1).between(start, end) | ((group[x].shift(-1) > end) & (df[x] < start))
+    after_previous = group[x].shift(1).between(start, end) | ((group[x].shift(1) < start) & (df[x] > end))
+    return df[inside | before_next | after_previous]
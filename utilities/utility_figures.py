@@ -0,0 +1,188 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from klupps_metrics import default_metrics
+from utilities.data.utility_data import UtilityData
+from utilities.data.utility_data_cache import UtilityDataCache
+from utilities.downsampling import clip_to_range, downsample
+
+logger = logging.getLogger(__name__)
+
+GRAPH_TYPES = ['Consumption', 'Price']
+# Resolution of the measurements in the graph: the daily series or its rollups.
+GRANULARITIES = {'D': 'Daily', 'W': 'Weekly', 'M': 'Monthly', 'Y': 'Contract Year'}
+
+# Points kept per trace for every pixel of graph width, and the least kept on narrow graphs.
+POINTS_PER_PIXEL = 0.5
+MIN_POINTS = 100
+
+
+def point_budget(width):
+    """Maximum points per trace for a graph `width` pixels wide, None (keep all) when the width is unknown."""
+    if not width:
+        return None
+    return max(int(width * POINTS_PER_PIXEL), MIN_POINTS)
+
+
+def create_line_plot(utility_data: UtilityData, utility_type, contract_period, utility_graph_type, template,
+                     max_points=None, x_range=None, granularity='D'):
+    # plotly.express takes a while to load, it is only needed once figures are built.
+    import plotly.express as px
+
+    with default_metrics.timer('utility_figure_stage_seconds', stage='select'):
+        contracts_df = utility_data.index.contracts(utility_type, contract_period)
+        c = dict(zip(sorted(contracts_df['ID'].unique()), px.colors.qualitative.G10))
+        # Other than daily, the aggregates at the end of every period are plotted, with the sums of the period.
+        if granularity == 'D':
+            measurements_df = utility_data.index.measurements(contracts_df['ID'])
+        else:
+            measurements_df = utility_data.index.rollups(granularity, contracts_df['ID'])
+        period_columns = [] if granularity == 'D' else ['period_amount']
+        payment_plan_df = utility_data.index.payment_plan(contracts_df['ID'])
+        df = pd.DataFrame(['contract', 'date', 'amount', 'type'])
+        if utility_graph_type == 'Price':
+            unit_type = 'EUR'
+            mdf = measurements_df[['date', 'aggregate_price', 'contract'] +
+                                  (['price'] if period_columns else [])].copy()
+            mdf.columns = ['date', 'amount', 'contract'] + period_columns
+            mdf['type'] = 'Spent'
+
+            pdf = payment_plan_df[['PaymentDate', 'AggregatePaymentAmount', 'ContractID']].copy()
+            pdf.columns = ['date', 'amount', 'contract']
+            pdf['type'] = 'Payment'
+
+            df = pd.concat([df, mdf, pdf], ignore_index=True)
+        else:
+            unit_type = 'kWh'
+            mdf = measurements_df[['date', 'aggregate_consumption', 'contract'] +
+                                  (['consumption'] if period_columns else [])].copy()
+            mdf.columns = ['date', 'amount', 'contract'] + period_columns
+            mdf['type'] = 'Consumed'
+            df = pd.concat([df, mdf], ignore_index=True)
+
+        df['date'] = pd.to_datetime(df['date'])
+        df.sort_values(by='date', inplace=True, ignore_index=True)
+    with default_metrics.timer('utility_figure_stage_seconds', stage='downsample'):
+        if x_range is not None:
+            df = clip_to_range(df, 'date', ['contract', 'type'], pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1]))
+        if max_points is not None:
+            df = downsample(df, 'date', 'amount', ['contract', 'type'], max_points)
+    with default_metrics.timer('utility_figure_stage_seconds', stage='plot'):
+        fig = px.line(
+            df,
+            x='date',
+            y='amount',
+            color='contract',
+            color_discrete_map=c,
+            title=f"{utility_type} {utility_graph_type} by Contract" +
+                  (f" ({GRANULARITIES[granularity]})" if granularity != 'D' else ""),
+            hover_data=dict({'amount': ':.2f'}, **{column: ':.2f' for column in period_columns}),
+            line_dash='type',
+            # A contract year is a single point per contract, coarse resolutions mark every period.
+            markers=granularity != 'D',
+            labels={
+                "date": "",
+                "amount": f"{unit_type}",
+                "contract": "Contract",
+                "type": "",
+                "period_amount": f"{unit_type} in {GRANULARITIES[granularity].lower()}"
+            },
+            template=template)
+    fig.update_layout(
+        transition_duration=500,
+        margin_r=0,
+        margin_l=0,
+        legend=dict(
+            orientation='h'
+        ),
+        title=dict(
+            xanchor='center', x=0.5
+        ),
+        # Keep the user's zoom while the figure is refined for it.
+        uirevision=f"{utility_type} {utility_graph_type}"
+    )
+    if x_range is not None:
+        fig.update_xaxes(range=x_range)
+
+    return fig
+
+
+class UtilityFigureCache:
+    """
+    LRU cache of utility figures keyed on the snapshot version and the graph inputs.
+
+    Figures are built without a template, the browser applies the template of the current theme, which keeps it out of
+    every response. Figures of older versions are dropped when the utility data cache publishes a new snapshot. With
+    `prewarm` the default view (whole contract period) of every utility type and graph type is built in the background
+    right after every refresh, for the point budgets of the graphs that asked for figures recently, so the first views
+    after a refresh are cache hits as well.
+    """
+
+    def __init__(self, utility_data_cache: UtilityDataCache, max_size: int = 64, prewarm: bool = True):
+        self.utility_data_cache = utility_data_cache
+        self.max_size = max_size
+        self.prewarm = prewarm
+        self.figures = OrderedDict()
+        # Point budgets clients asked for recently, the figures are prewarmed for these.
+        self.recent_max_points = OrderedDict()
+        self._lock = threading.Lock()
+        self._prewarm_thread = None
+        utility_data_cache.add_listener(self.on_refresh)
+
+    def get(self, version, utility_type, contract_period, utility_graph_type, max_points=None, x_range=None,
+            granularity='D'):
+        version = self.utility_data_cache.resolve_version(version)
+        key = (version, utility_type, tuple(contract_period or ()), utility_graph_type, max_points,
+               tuple(x_range or ()), granularity)
+        with self._lock:
+            self.recent_max_points[max_points] = None
+            self.recent_max_points.move_to_end(max_points)
+            while len(self.recent_max_points) > 4:
+                self.recent_max_points.popitem(last=False)
+            fig = self.figures.get(key)
+            if fig is not None:
+                self.figures.move_to_end(key)
+                default_metrics.inc('utility_figure_cache_total', result='hit')
+                return fig
+        default_metrics.inc('utility_figure_cache_total', result='miss')
+        utility_data = self.utility_data_cache.get_version(version)
+        fig = create_line_plot(utility_data, utility_type, contract_period, utility_graph_type, 'none',
+                               max_points, x_range, granularity)
+        with self._lock:
+            self.figures[key] = fig
+            while len(self.figures) > self.max_size:
+                self.figures.popitem(last=False)
+        return fig
+
+    def on_refresh(self, version: int, utility_data: UtilityData):
+        with self._lock:
+            for key in [key for key in self.figures if key[0] != version]:
+                del self.figures[key]
+        if self.prewarm:
+            self._prewarm_thread = threading.Thread(target=self._prewarm, args=(version, utility_data),
+                                                    name="utility-figure-prewarm", daemon=True)
+            self._prewarm_thread.start()
+
+    def join_prewarm(self, timeout: float = None):
+        """Wait until the figures of the last refresh are prewarmed."""
+        thread = self._prewarm_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _prewarm(self, version: int, utility_data: UtilityData):
+        try:
+            with self._lock:
+                budgets = list(self.recent_max_points) or [None]
+            for utility_type in utility_data.index.types:
+                years = utility_data.index.contracts(utility_type).ContractYear
+                contract_period = [int(years.min()), int(years.max())]
+                for utility_graph_type in GRAPH_TYPES:
+                    for max_points in budgets:
+                        if version != self.utility_data_cache.version:
+                            return
+                        self.get(version, utility_type, contract_period, utility_graph_type, max_points)
+        except Exception:
+            logger.exception("Prewarming utility figures of version %d failed", version)